@@ -0,0 +1,10 @@
+"""
+Benchmarks of htmlwriter.  Run the modules from the top directory of the
+source tree, e.g. ::
+
+    python -m benchmarks.suite --output results.json
+
+`benchmarks.corpus` generates the documents, `benchmarks.suite` measures
+the conversion phases on all corpora; the other modules are focused
+micro-benchmarks and stress checks.
+"""
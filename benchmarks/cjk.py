@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+"""
+Benchmark: translation of CJK-heavy paragraphs.
+
+    python -m benchmarks.cjk [PARAGRAPHS [REPEAT]]
+
+Prints the best time of REPEAT translations of a parsed document.
+"""
+
+import sys
+import time
+from docutils.core import Publisher, publish_doctree
+import htmlwriter
+from benchmarks import corpus
+
+
+def main(paragraphs=2000, repeat=5):
+    pub = Publisher(writer=htmlwriter.Writer())
+    pub.set_components('standalone', 'restructuredtext', 'html')
+    settings = pub.get_settings(report_level=4)
+    document = publish_doctree(corpus.cjk(paragraphs), settings=settings)
+    best = None
+    for i in range(repeat):
+        writer = htmlwriter.Writer()
+        writer.document = document.deepcopy()
+        start = time.time()
+        writer.translate()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('%d paragraphs: %.3f s' % (paragraphs, best))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""
+Stress check: convert many math-heavy documents on a thread pool and
+compare the output with serial conversion.  Exits with status 1 if any
+document differs.
+
+    python -m benchmarks.concurrency [DOCUMENTS [THREADS]]
+"""
+
+import sys
+import htmlwriter
+from htmlwriter import pool
+
+
+formulas = [r'x^{%d}', r'\alpha_{%d} + \beta', r'\frac{a_{%d}}{b}',
+            r'\sqrt{%d}', r'\sum_{i=0}^{%d} i^2', r'e^{i\pi %d}']
+
+
+def make_document(n):
+    lines = ['Document %d' % n, '=' * 20, '']
+    for i in range(40):
+        formula = formulas[(n + i) % len(formulas)] % (n * 40 + i)
+        lines.append('Inline :math:`%s` and text.' % formula)
+        lines.append('')
+        lines.append('.. math:: %s' % formula)
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def main(documents=200, threads=8):
+    if hasattr(sys, 'setswitchinterval'):
+        sys.setswitchinterval(1e-6)  # switch threads as often as possible
+    sources = [make_document(n) for n in range(documents)]
+    failures = 0
+    for math_output in ('HTML math.css', 'MathJax', 'LaTeX'):
+        settings = pool.get_settings({'math_output': math_output})
+        htmlwriter.math_cache.clear()
+        serial = [pool.publish_parts(source, settings)['whole']
+                  for source in sources]
+        htmlwriter.math_cache.clear()
+        concurrent = [parts['whole'] for parts in
+                      pool.publish_parts_many(sources, settings, threads)]
+        differing = sum(a != b for a, b in zip(serial, concurrent))
+        print('%-14s %d documents, %d differ' % (math_output, documents,
+                                                 differing))
+        failures += differing
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic reStructuredText corpora.
+
+Every generator takes a size parameter `n` and returns the source text;
+the output only depends on `n`, so runs on different machines or
+revisions convert the same documents.  `generators` maps the corpus
+names to the generators.
+"""
+
+import os
+import struct
+import tempfile
+import zlib
+
+
+def deep_lists(n):
+    """`n` top-level list items, each with four levels of nested lists."""
+    lines = ['Deep lists', '==========', '']
+    for i in range(n):
+        for depth in range(5):
+            indent = '  ' * depth
+            lines.append('%s- item %d.%d with *emphasis*' % (indent, i, depth))
+            lines.append('')
+        lines.append('%s  A second paragraph makes the item non-simple.'
+                     % ('  ' * 4))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def table(n):
+    """A CSV table with `n` cells (10 columns)."""
+    columns = 10
+    lines = ['Table', '=====', '', '.. csv-table:: Numbers',
+             '   :header-rows: 1', '',
+             '   ' + ', '.join('"column %d"' % c for c in range(columns))]
+    for row in range(max(1, n // columns)):
+        lines.append('   ' + ', '.join('"%d *x*"' % (row * columns + c)
+                                       for c in range(columns)))
+    return '\n'.join(lines) + '\n'
+
+
+formulas = [r'x^{%d}', r'\alpha_{%d} + \beta', r'\frac{a_{%d}}{b}',
+            r'\sqrt{%d}', r'\sum_{i=0}^{%d} i^2', r'e^{i\pi %d}']
+
+
+def math(n):
+    """`n` paragraphs with inline math, every other one with a block."""
+    lines = ['Math', '====', '']
+    for i in range(n):
+        formula = formulas[i % len(formulas)] % i
+        lines.append('Inline :math:`%s` and text.' % formula)
+        lines.append('')
+        if i % 2:
+            lines.extend(['.. math:: %s' % formula, ''])
+    return '\n'.join(lines)
+
+
+cjk_sentences = [u'日本語の文章です。',
+                 u'*強調*と **太字** の後。',
+                 u'``コード`` と `参照 <http://example.com/>`_ 。',
+                 u'English と日本語。']
+
+
+def cjk(n):
+    """`n` paragraphs of Japanese prose with inline markup."""
+    lines = [u'日本語', u'======', u'']
+    for i in range(n):
+        for j in range(6):
+            lines.append(cjk_sentences[(i + j) % len(cjk_sentences)])
+        lines.append(u'')
+        if i % 10 == 0:
+            lines.extend([u'- リスト', u'  項目', u''])
+    return u'\n'.join(lines)
+
+
+prose_sentences = [
+    'The quick brown fox jumps over the lazy dog.',
+    'Plain prose without any markup is the common case,',
+    'with *emphasis*, **strong** text and ``literals``',
+    'and sometimes a `link <http://example.com/a?b=1&c=2>`_',
+    'or an address like someone@example.com in between.',
+    'Few runs need escaping: a < b && c > d.']
+
+
+def prose(n):
+    """`n` paragraphs of English prose, a section every 20 paragraphs."""
+    lines = []
+    for i in range(n):
+        if i % 20 == 0:
+            lines.extend(['Section %d' % i, '=' * 20, ''])
+        for j in range(5):
+            lines.append(prose_sentences[(i + j) % len(prose_sentences)])
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def literal(n):
+    """A code document: `n` literal blocks, doctests and inline literals."""
+    lines = ['Code', '====', '']
+    for i in range(n):
+        lines.extend([
+            'Call ``function_%d(x, y)`` with ``x  =  %d``::' % (i, i), '',
+            '    def function_%d(x, y):' % i,
+            '        """Return  x < y & %d."""' % i,
+            '        return x < y and x != %d' % i, '',
+            '>>> function_%d(1, 2)' % i, 'True', ''])
+    return '\n'.join(lines)
+
+
+def png(width, height):
+    """Return a minimal grayscale PNG image."""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+    rows = b''.join(b'\0' + b'\xff' * width for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height,
+                                         8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+image_dir = None
+
+
+def images(n):
+    """`n` scaled figures referring to 20 PNG files in a temporary directory."""
+    global image_dir
+    if image_dir is None:
+        image_dir = tempfile.mkdtemp(prefix='htmlwriter-benchmark-')
+        for i in range(20):
+            with open(os.path.join(image_dir, 'image%d.png' % i), 'wb') as f:
+                f.write(png(16 + i, 8 + i))
+    lines = ['Figures', '=======', '']
+    for i in range(n):
+        path = os.path.join(image_dir, 'image%d.png' % (i % 20))
+        lines.extend(['.. figure:: %s' % path.replace('\\', '/'),
+                      '   :scale: 50%', '   :alt: figure %d' % i, '',
+                      '   Caption of figure %d.' % i, ''])
+    return '\n'.join(lines)
+
+
+def footnotes(n):
+    """A paper with `n` paragraphs, each citing footnotes and citations."""
+    lines = ['Paper', '=====', '']
+    for i in range(n):
+        lines.append('Claim %d [#]_ is supported by [CIT%d]_ and [#]_.'
+                     % (i, i % 50))
+        lines.append('')
+    for i in range(n):
+        lines.extend(['.. [#] Footnote %da.' % i, '',
+                      '.. [#] Footnote %db with *markup*.' % i, ''])
+    for i in range(min(n, 50)):
+        lines.extend(['.. [CIT%d] Author %d, *Title*, 20%02d.' % (i, i, i),
+                      ''])
+    return '\n'.join(lines)
+
+
+generators = {
+    'deep_lists': deep_lists,
+    'table': table,
+    'math': math,
+    'cjk': cjk,
+    'prose': prose,
+    'literal': literal,
+    'images': images,
+    'footnotes': footnotes,
+}
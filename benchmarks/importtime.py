@@ -0,0 +1,77 @@
+"""
+Benchmark: import time of ``htmlwriter`` and ``htmlwriter.rst2htmlr``.
+
+    python -m benchmarks.importtime [RUNS]
+
+Imports each module in a fresh interpreter RUNS times with
+``python -X importtime`` and prints the best cumulative import time, the
+slowest modules imported with it, and the optional heavy modules (image
+and math support) that were imported although no document was converted.
+"""
+
+import os
+import subprocess
+import sys
+
+
+modules = ['htmlwriter', 'htmlwriter.rst2htmlr']
+
+deferred = ['PIL', 'Image', 'urllib.request', 'htmlwriter.imagesize',
+            'htmlwriter.profiling', 'docutils.transforms.writer_aux',
+            'docutils.utils.math.math2html',
+            'docutils.utils.math.unichar2tex',
+            'docutils.utils.math.latex2mathml']
+"""Modules which must only be imported when a document needs them."""
+
+
+def run(code, importtime=False):
+    """Run `code` in a fresh interpreter; return (stdout, stderr)."""
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)  # measure with .pyc files
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [path for path in [env.get('PYTHONPATH')] if path])
+    command = [sys.executable] + ['-X', 'importtime'] * importtime
+    process = subprocess.Popen(command + ['-c', code], env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    return process.communicate()
+
+
+def parse_importtime(stderr):
+    """Return a list of (cumulative us, self us, module) tuples."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        entries.append((int(cumulative), int(own), name.strip()))
+    return entries
+
+
+def main(runs=10):
+    for module in modules:
+        run('import %s' % module)  # write the .pyc files
+        best = None
+        for i in range(runs):
+            entries = parse_importtime(run('import %s' % module, True)[1])
+            total = [entry for entry in entries if entry[2] == module]
+            if total and (best is None or total[0][0] < best[0][0]):
+                best = (total[0], entries)
+        if best is None:
+            print('%s: -X importtime is not supported' % module)
+            continue
+        print('%-22s %8.1f ms' % (module, best[0][0] / 1000.0))
+        for cumulative, own, name in sorted(
+                best[1], key=lambda entry: entry[1], reverse=True)[:5]:
+            print('    %-40s %6.1f ms self' % (name, own / 1000.0))
+        loaded = run('import sys, %s\nfor name in %r:\n'
+                     '    if name in sys.modules: print(name)'
+                     % (module, deferred))[0].split()
+        if loaded:
+            print('    imported eagerly: %s' % ', '.join(loaded))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
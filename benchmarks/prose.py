@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""
+Benchmark: translation of prose-heavy documents, dominated by
+`HTMLTranslator.encode` and `attval`.
+
+    python -m benchmarks.prose [PARAGRAPHS [REPEAT]]
+
+Prints the best time of REPEAT translations of a parsed document and the
+cost per call of `encode` on plain and on escaped text.
+"""
+
+import sys
+import time
+import timeit
+from docutils.core import Publisher, publish_doctree
+import htmlwriter
+from benchmarks import corpus
+
+
+def main(paragraphs=3000, repeat=5):
+    pub = Publisher(writer=htmlwriter.Writer())
+    pub.set_components('standalone', 'restructuredtext', 'html')
+    settings = pub.get_settings(report_level=4)
+    document = publish_doctree(corpus.prose(paragraphs), settings=settings)
+    best = None
+    for i in range(repeat):
+        writer = htmlwriter.Writer()
+        writer.document = document.deepcopy()
+        start = time.time()
+        writer.translate()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('%d paragraphs: %.3f s' % (paragraphs, best))
+
+    translator = htmlwriter.HTMLTranslator(document)
+    for text in (corpus.prose_sentences[0], corpus.prose_sentences[-1]):
+        calls = 200000
+        seconds = min(timeit.repeat(lambda: translator.encode(text),
+                                    number=calls, repeat=3))
+        print('encode(%r): %.3f us/call' % (text[:20], seconds / calls * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
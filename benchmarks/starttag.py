@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+"""
+Micro-benchmark: cost of `HTMLTranslator.starttag` per call.
+
+    python -m benchmarks.starttag [CALLS]
+
+Times typical calls (plain tags, tags with a constant CLASS, nodes with
+ids and classes, links with attributes) on a translator instance.
+"""
+
+import sys
+import timeit
+from docutils import nodes
+from docutils.core import Publisher
+from docutils.utils import new_document
+import htmlwriter
+
+
+def make_translator():
+    pub = Publisher(writer=htmlwriter.Writer())
+    pub.set_components('standalone', 'restructuredtext', 'html')
+    document = new_document('<bench>', pub.get_settings())
+    return htmlwriter.HTMLTranslator(document)
+
+
+def main(calls=200000):
+    translator = make_translator()
+    plain = nodes.paragraph()
+    target = nodes.section(ids=['intro', 'first'], classes=['special'])
+    cases = [
+        ('<p>', lambda: translator.starttag(plain, 'p', '')),
+        ('<li>', lambda: translator.starttag(plain, 'li', '')),
+        ('<span class="pre">',
+         lambda: translator.starttag(plain, 'span', '', CLASS='pre')),
+        ('<a class="reference external">',
+         lambda: translator.starttag(plain, 'a', '',
+                                     CLASS='reference external')),
+        ('<a href=...>',
+         lambda: translator.starttag(plain, 'a', '', href='#intro',
+                                     CLASS='reference internal')),
+        ('ids and classes',
+         lambda: translator.starttag(target, 'section', CLASS='x')),
+    ]
+    for name, call in cases:
+        best = min(timeit.repeat(call, number=calls, repeat=3))
+        print('%-32s %7.3f us/call' % (name, best / calls * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,272 @@
+"""
+Benchmark suite: convert the synthetic corpora of `benchmarks.corpus` and
+measure the parse, transform, translate and template phases separately,
+for `htmlwriter.Writer` and the HTML writers of Docutils as a baseline.
+
+    python -m benchmarks.suite [options]
+
+Prints a table and writes the results as JSON (``--output``), which can be
+compared with an earlier run (``--compare``).  With ``--scaling``, every
+corpus is also converted at growing sizes and phases whose time grows
+faster than ``size ** threshold`` are reported; the exit status is 1 if
+there are any.
+"""
+
+import argparse
+import io
+import json
+import math
+import platform
+import sys
+import time
+import docutils
+from docutils import languages, utils
+from docutils.core import Publisher
+from docutils.writers import get_writer_class
+import htmlwriter
+from benchmarks import corpus
+
+try:
+    clock = time.perf_counter
+except AttributeError:  # Python 2
+    clock = time.time
+
+
+writer_classes = {'htmlwriter': htmlwriter.Writer}
+for name, docutils_name in (('html4css1', 'html4css1'),
+                            ('html5', 'html5_polyglot')):
+    try:
+        writer_classes[name] = get_writer_class(docutils_name)
+    except ImportError:
+        pass
+
+default_sizes = {
+    'deep_lists': 100,
+    'table': 10000,  # cells
+    'math': 200,
+    'cjk': 300,
+    'prose': 500,
+    'literal': 200,
+    'images': 200,
+    'footnotes': 200,
+}
+
+math_outputs = ['HTML math.css', 'MathJax', 'LaTeX', 'MathML']
+
+phases = ('parse', 'transform', 'translate', 'template')
+
+
+def convert(writer_name, source, settings_overrides):
+    """
+    Convert `source` once and return the time of each phase (and the
+    total) in seconds and the size of the output.
+    """
+    writer = writer_classes[writer_name]()
+    htmlwriter.math_cache.clear()  # measure the conversion of the math
+    pub = Publisher(writer=writer)
+    pub.set_components('standalone', 'restructuredtext', 'html')
+    settings = pub.get_settings(report_level=5, halt_level=5,
+                                warning_stream=io.StringIO(),
+                                **settings_overrides)
+    times = {}
+    start = clock()
+    document = utils.new_document('<corpus>', settings)
+    pub.parser.parse(source, document)
+    times['parse'] = clock() - start
+
+    start = clock()
+    document.transformer.populate_from_components(
+        (pub.reader, pub.parser, writer))
+    document.transformer.apply_transforms()
+    times['transform'] = clock() - start
+
+    start = clock()
+    writer.document = document
+    writer.language = languages.get_language(settings.language_code,
+                                             document.reporter)
+    writer.visitor = visitor = writer.translator_class(document)
+    document.walkabout(visitor)
+    times['translate'] = clock() - start
+
+    start = clock()
+    for attr in writer.visitor_attributes:
+        setattr(writer, attr, getattr(visitor, attr))
+    if isinstance(writer, htmlwriter.Writer):
+        writer.parts = htmlwriter.DocumentParts(writer)
+    output = writer.apply_template()
+    times['template'] = clock() - start
+
+    times['total'] = sum(times[phase] for phase in phases)
+    return times, len(output.encode('utf-8'))
+
+
+def measure(corpus_name, size, writer_name, math_output, repeat):
+    """Return the result entry of the best of `repeat` conversions."""
+    source = corpus.generators[corpus_name](size)
+    overrides = {}
+    if math_output:
+        overrides['math_output'] = math_output
+    result = {'corpus': corpus_name, 'size': size, 'writer': writer_name,
+              'math_output': math_output}
+    best = None
+    for i in range(repeat):
+        try:
+            times, output_bytes = convert(writer_name, source, overrides)
+        except Exception as err:
+            result['error'] = '%s: %s' % (err.__class__.__name__, err)
+            return result
+        if best is None:
+            best = times
+        else:
+            for name in best:
+                best[name] = min(best[name], times[name])
+    result['times'] = best
+    result['output_bytes'] = output_bytes
+    return result
+
+
+def exponent(sizes, times):
+    """The growth exponent k of times ~ sizes ** k (first to last)."""
+    if times[0] <= 0 or times[-1] <= 0:
+        return 0.0
+    return math.log(times[-1] / times[0]) / math.log(sizes[-1] / sizes[0])
+
+
+def scaling(corpus_name, size, writer_name, math_output, repeat, steps,
+            threshold):
+    """
+    Convert the corpus at `steps` doubling sizes and return the scaling
+    entry.  Phases taking less than 10% of the total time are not
+    flagged, their times are too small to be reliable.
+    """
+    sizes = [size * 2 ** step for step in range(steps)]
+    results = [measure(corpus_name, n, writer_name, math_output, repeat)
+               for n in sizes]
+    entry = {'corpus': corpus_name, 'writer': writer_name,
+             'math_output': math_output, 'sizes': sizes}
+    errors = [result['error'] for result in results if 'error' in result]
+    if errors:
+        entry['error'] = errors[0]
+        return entry
+    entry['times'] = dict(
+        (name, [result['times'][name] for result in results])
+        for name in phases + ('total',))
+    entry['exponents'] = dict(
+        (name, exponent(sizes, entry['times'][name]))
+        for name in entry['times'])
+    total = entry['times']['total'][-1]
+    entry['superlinear'] = sorted(
+        name for name, value in entry['exponents'].items()
+        if value > threshold
+        and (name == 'total' or entry['times'][name][-1] >= 0.1 * total))
+    return entry
+
+
+def key(result):
+    return (result['corpus'], result['size'], result['writer'],
+            result['math_output'])
+
+
+def print_results(results, baseline=None):
+    old = dict((key(result), result) for result in baseline or ()
+               if 'times' in result)
+    print('%-11s %6s %-10s %-13s' % ('corpus', 'size', 'writer', 'math')
+          + ''.join('%10s' % name for name in phases + ('total',))
+          + ('     ratio' if baseline else ''))
+    for result in results:
+        line = '%-11s %6d %-10s %-13s' % (
+            result['corpus'], result['size'], result['writer'],
+            result['math_output'] or '')
+        if 'error' in result:
+            print(line + '  ' + result['error'][:60])
+            continue
+        times = result['times']
+        line += ''.join('%10.4f' % times[name]
+                        for name in phases + ('total',))
+        if key(result) in old:
+            line += '%10.2f' % (times['total']
+                                / old[key(result)]['times']['total'])
+        print(line)
+
+
+def print_scaling(entries, threshold):
+    print('\nscaling exponents (flagged above %.2f):' % threshold)
+    for entry in entries:
+        line = '%-11s %-10s %-13s' % (entry['corpus'], entry['writer'],
+                                      entry['math_output'] or '')
+        if 'error' in entry:
+            print(line + '  ' + entry['error'][:60])
+            continue
+        line += ''.join('%10.2f' % entry['exponents'][name]
+                        for name in phases + ('total',))
+        if entry['superlinear']:
+            line += '  SUPER-LINEAR: ' + ', '.join(entry['superlinear'])
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark htmlwriter on synthetic corpora.')
+    parser.add_argument('--corpus', action='append',
+                        choices=sorted(corpus.generators),
+                        help='corpus to convert (repeatable; default: all)')
+    parser.add_argument('--writer', action='append',
+                        choices=sorted(writer_classes),
+                        help='writer to measure (repeatable; default: all)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='factor applied to the default corpus sizes '
+                        '(e.g. 10 for a 100k-cell table)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='conversions per measurement, the best '
+                        'time of each phase is reported')
+    parser.add_argument('--scaling', action='store_true',
+                        help='also measure htmlwriter at growing sizes')
+    parser.add_argument('--steps', type=int, default=3,
+                        help='number of doubling sizes of --scaling')
+    parser.add_argument('--threshold', type=float, default=1.3,
+                        help='growth exponent above which a phase is '
+                        'reported as super-linear')
+    parser.add_argument('--output', '-o', metavar='FILE',
+                        help='write the results as JSON to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='JSON results of an earlier run; print the '
+                        'ratio of the total times')
+    args = parser.parse_args(argv)
+
+    corpora = args.corpus or sorted(corpus.generators)
+    writers = args.writer or sorted(writer_classes)
+    results = []
+    entries = []
+    for corpus_name in corpora:
+        size = max(1, int(default_sizes[corpus_name] * args.scale))
+        modes = math_outputs if corpus_name == 'math' else [None]
+        for math_output in modes:
+            for writer_name in writers:
+                results.append(measure(corpus_name, size, writer_name,
+                                       math_output, args.repeat))
+            if args.scaling:
+                entries.append(scaling(corpus_name, size, 'htmlwriter',
+                                       math_output, args.repeat, args.steps,
+                                       args.threshold))
+
+    baseline = None
+    if args.compare:
+        with io.open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+    if args.scaling:
+        print_scaling(entries, args.threshold)
+    if args.output:
+        report = {'python': platform.python_version(),
+                  'implementation': platform.python_implementation(),
+                  'platform': platform.platform(),
+                  'docutils': docutils.__version__,
+                  'scale': args.scale, 'repeat': args.repeat,
+                  'results': results, 'scaling': entries}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    return 1 if any(entry.get('superlinear') for entry in entries) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,30 +23,26 @@ except NameError:
 
 import sys
 import os
+import collections
 import os.path
 import time
 import re
-try:
-    from urllib.request import url2pathname
-except ImportError:
-    from urllib import url2pathname
 import io
-try: # check for the Python Imaging Library
-    import PIL.Image
-except ImportError:
-    try:  # sometimes PIL modules are put in PYTHONPATH's root
-        import Image
-        class PIL(object): pass  # dummy wrapper
-        PIL.Image = Image
-    except ImportError:
-        PIL = None
+import json
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # Python 2
+    from collections import MutableMapping
+import threading
 import docutils
 import docutils.io
 from docutils import frontend, nodes, utils, writers, languages
 from docutils.utils.error_reporting import SafeString
-from docutils.transforms import writer_aux
-from docutils.utils.math import unichar2tex, pick_math_environment, math2html
-from docutils.utils.math.latex2mathml import parse_latex_math
+
+try:
+    replace = os.replace
+except AttributeError:  # Python 2
+    replace = os.rename
 
 class Writer(writers.Writer):
 
@@ -90,6 +86,12 @@ class Writer(writers.Writer):
           'Default: embed stylesheets.',
           ['--link-stylesheet'],
           {'dest': 'embed_stylesheet', 'action': 'store_false'}),
+         ('Copy the stylesheet files (and the math stylesheet) to <directory> '
+          'under names containing a hash of their content, e.g. '
+          '"htmlwriter.3f2a9c81.css", and link to the copies instead of '
+          'embedding the stylesheets.  Copies are written only once.',
+          ['--asset-dir'],
+          {'metavar': '<directory>'}),
          ('Comma-separated list of directories where stylesheets are found. '
           'Used by --stylesheet-path when expanding relative path arguments. '
           'Default: "%s"' % default_stylesheet_dirs,
@@ -151,6 +153,63 @@ class Writer(writers.Writer):
           'or "LaTeX". Default: "HTML math.css"',
           ['--math-output'],
           {'default': 'HTML math.css'}),
+         ('Cache file for converted math (MathML and HTML math output).  '
+          'Default: keep converted math in memory only.',
+          ['--math-cache'],
+          {'metavar': '<file>'}),
+         ('Cache file for the image sizes used to scale images '
+          '(see the "scale" option of the "image" directive).  '
+          'Default: keep the sizes in memory only.',
+          ['--image-size-cache'],
+          {'metavar': '<file>'}),
+         ('Reuse the HTML of headers, footers, admonitions, topics, '
+          'sidebars and tables that were already translated with the same '
+          'contents and settings in this process, e.g. shared snippets '
+          'included in the documents of a batch.',
+          ['--fragment-cache'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
+         ('Translate the top-level sections in <processes> worker '
+          'processes (on platforms supporting fork).  The output is the '
+          'same as without the option.  Default: 0 (no worker processes).',
+          ['--parallel-sections'],
+          {'default': 0, 'metavar': '<processes>',
+           'validator': frontend.validate_nonnegative_int}),
+         ('Also write the output compressed with gzip to <destination>.gz, '
+          'e.g. for the "gzip_static" module of nginx.  Only for output '
+          'files.',
+          ['--precompress'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
+         ('Compression level of --precompress, 0 (none) to 9 (best).  '
+          'Default: 9.',
+          ['--precompress-level'],
+          {'default': 9, 'metavar': '<level>',
+           'validator': frontend.validate_nonnegative_int}),
+         ('Do not write (and remove) the --precompress file if the output is '
+          'smaller than <bytes>.  Default: 256.',
+          ['--precompress-min-size'],
+          {'default': 256, 'metavar': '<bytes>',
+           'validator': frontend.validate_nonnegative_int}),
+         ('Minify the output: remove the whitespace between tags next to '
+          'block elements (except in preformatted elements) and the '
+          'comments and whitespace of embedded stylesheets.  Use '
+          '--strip-comments to omit comments, too.',
+          ['--minify'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
+         ('Write the HTML to the destination file while the document is '
+          'translated instead of assembling it in memory.  Only the parts '
+          'preceding the body are buffered.  The template must use the '
+          'body part exactly once and must not use the fragment or '
+          'html_body parts, else the output is buffered as usual.',
+          ['--stream-output'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
+         ('Profile the translation: report the calls, the cumulative and '
+          'the own time and the output size of every visit_ and depart_ '
+          'method and of the image and math helpers as a table on stderr.',
+          ['--profile-translator'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
+         ('Also write the --profile-translator report as JSON to <file>.',
+          ['--profile-translator-file'],
+          {'metavar': '<file>'}),
          ('Omit the XML declaration.  Use with caution.',
           ['--no-xml-declaration'],
           {'dest': 'xml_declaration', 'default': 1, 'action': 'store_false',
@@ -172,40 +231,177 @@ class Writer(writers.Writer):
         'html_prolog', 'html_head', 'html_title', 'html_subtitle',
         'html_body')
 
+    streamed_parts = ('body', 'fragment', 'html_body')
+    """Parts that are incomplete when the output is streamed."""
+
+    stream = None
+    """The `OutputStream` of a streamed translation."""
+
+    streamed = False
+    """True if the last document was written while it was translated."""
+
     def get_transforms(self):
+        from docutils.transforms import writer_aux
         return writers.Writer.get_transforms(self) + [writer_aux.Admonitions]
 
     def __init__(self):
         writers.Writer.__init__(self)
         self.translator_class = HTMLTranslator
 
+    def write(self, document, destination):
+        """
+        Translate `document` and write it to `destination`.  With the
+        "stream_output" setting, the output is written to a file
+        destination while the document is translated and None is returned.
+        With the "precompress" setting, a compressed copy of an output file
+        is written, too.
+        """
+        settings = document.settings
+        self.streamed = False
+        gzip_output = None
+        if (settings.precompress
+            and isinstance(destination, docutils.io.FileOutput)
+            and destination.destination_path not in (None, '-')
+            and destination.destination not in (sys.stdout, sys.stderr)):
+            from htmlwriter.output import GzipOutput
+            gzip_output = GzipOutput(destination, settings.precompress_level,
+                                     settings.precompress_min_size)
+        if not (settings.stream_output
+                and isinstance(destination, docutils.io.FileOutput)):
+            return self.write_output(document, destination, gzip_output)
+        texts = Template.load(settings.template).split('body')
+        if (texts is None or Template(''.join(texts)).names.intersection(
+                self.streamed_parts)):
+            document.reporter.warning(
+                'The template does not allow streaming output.')
+            return self.write_output(document, destination, gzip_output)
+        self.document = document
+        self.language = languages.get_language(
+            settings.language_code, document.reporter)
+        self.destination = destination
+        self.stream = OutputStream(self, destination, *texts,
+                                   gzip_output=gzip_output)
+        self.streamed = True
+        autoclose = destination.autoclose
+        destination.autoclose = False
+        try:
+            self.translate()
+        except BaseException:
+            if gzip_output:
+                gzip_output.abort()
+            raise
+        finally:
+            self.stream = None
+            destination.autoclose = autoclose
+            if autoclose and destination.opened:
+                destination.close()
+        if gzip_output and gzip_output.close():
+            record_output(settings, gzip_output.path)
+        return self.output
+
+    def write_output(self, document, destination, gzip_output=None):
+        """Write the translated `document` to `destination` at once."""
+        output = writers.Writer.write(self, document, destination)
+        if gzip_output:
+            gzip_output.write(self.output)
+            if gzip_output.close():
+                record_output(document.settings, gzip_output.path)
+        return output
+
     def translate(self):
+        settings = self.document.settings
+        if settings.math_cache:
+            math_cache.load(settings.math_cache)
         self.visitor = visitor = self.translator_class(self.document)
-        self.document.walkabout(visitor)
+        if self.stream:
+            visitor.start_streaming(self.stream)
+        if settings.profile_translator:
+            from htmlwriter import profiling
+            translator_profile = profiling.instrument(visitor)
+        elif settings.parallel_sections:
+            from htmlwriter import parallel
+            visitor.sections = parallel.start(visitor,
+                                              settings.parallel_sections)
+        try:
+            self.document.walkabout(visitor)
+        finally:
+            if visitor.sections:
+                visitor.sections.close()
+        if settings.profile_translator:
+            translator_profile.report(self.document)
         for attr in self.visitor_attributes:
             setattr(self, attr, getattr(visitor, attr))
-        self.output = self.apply_template()
+        self.parts = DocumentParts(self)
+        if self.stream:
+            self.stream.close(visitor)
+            self.output = None
+        elif isinstance(self.destination, docutils.io.NullOutput):
+            # nothing is written: apply the template only if
+            # ``parts['whole']`` is used
+            self.output = None
+        else:
+            self.output = self.parts['whole']
+        self.document.reporter.debug('math cache: %d hits, %d misses'
+                                     % (math_cache.hits, math_cache.misses))
 
     def apply_template(self):
-        with io.open(self.document.settings.template, 'r',
-                     encoding='utf-8') as f:
-            template = f.read()
-        subs = self.interpolation_dict()
-        return template % subs
+        template = Template.load(self.document.settings.template)
+        subs = self.interpolation_dict(template.names)
+        return template.text % subs
 
-    def interpolation_dict(self):
+    def interpolation_dict(self, names=None, visitor=None):
+        """
+        Return the template substitutions.  If `names` is given, only the
+        parts in `names` are joined.  The parts are taken from `visitor`
+        if given, else from `parts`.
+        """
         subs = {}
         settings = self.document.settings
         for attr in self.visitor_attributes:
-            subs[attr] = ''.join(getattr(self, attr)).rstrip('\n')
+            if names is None or attr in names:
+                if visitor is None:
+                    part = self.parts[attr]
+                else:
+                    part = ''.join(getattr(visitor, attr))
+                subs[attr] = part.rstrip('\n')
         subs['encoding'] = settings.output_encoding
         subs['version'] = docutils.__version__
         return subs
 
     def assemble_parts(self):
-        writers.Writer.assemble_parts(self)
-        for part in self.visitor_attributes:
-            self.parts[part] = ''.join(getattr(self, part))
+        # with a `NullOutput` destination (see `htmlwriter.pool.convert`),
+        # the parts are joined on first access, see `DocumentParts`
+        settings = self.document.settings
+        if self.streamed:
+            # the body went to the destination, do not assemble "whole"
+            # and the body parts from what is left of it:
+            for name in ('whole',) + self.streamed_parts:
+                self.parts[name] = None
+        elif self.output is not None:
+            self.parts['whole'] = self.output
+        self.parts['encoding'] = settings.output_encoding
+        self.parts['errors'] = settings.output_encoding_error_handler
+        self.parts['version'] = docutils.__version__
+        if not isinstance(self.destination, docutils.io.NullOutput):
+            self.parts = dict(self.parts)
+
+
+def record_output(settings, path):
+    """
+    Add `path` to the files written in addition to the destination file,
+    if they are collected in ``settings._outputs`` (see `htmlwriter.batch`).
+    """
+    outputs = getattr(settings, '_outputs', None)
+    if outputs is not None:
+        outputs.append(path)
+
+
+def url2pathname(url):
+    try:
+        from urllib.request import url2pathname as convert
+    except ImportError:  # Python 2
+        from urllib import url2pathname as convert
+    return convert(url)
 
 
 class HTMLTranslator(nodes.NodeVisitor):
@@ -275,15 +471,53 @@ class HTMLTranslator(nodes.NodeVisitor):
     words_and_spaces = re.compile(r'\S+| +|\n')
     # wrap point inside word
     sollbruchstelle = re.compile(r'.+\W\W.+|[-?].+', re.U)
+    # characters replaced by `encode` ("&" first):
+    special_entities = (
+        (u'&', u'&amp;'),
+        (u'<', u'&lt;'),
+        (u'"', u'&quot;'),
+        (u'>', u'&gt;'),
+        (u'@', u'&#64;'), # may thwart some address harvesters
+        # TODO: convert non-breaking space only if needed?
+        (u'\u00a0', u'&nbsp;')) # non-breaking space
+    special_characters = re.compile(u'[&<>"@\u00a0]')
     # name changes to the 'lang' attribute of the html tag
     lang_attribute = 'lang'
 
+    stream = None
+    """The `OutputStream` receiving the body while it is generated."""
+
+    stream_chunk_size = 1000
+    """Number of `body` entries collected before they are streamed."""
+
+    prologue_classes = (nodes.Titular, nodes.meta, nodes.decoration,
+                        nodes.docinfo)
+    """Document children that may still change the head parts."""
+
+    fragment_classes = (nodes.header, nodes.footer, nodes.Admonition,
+                        nodes.topic, nodes.sidebar, nodes.table)
+    """Elements whose contents are kept in `fragment_cache`."""
+
+    fragment_state = ('section_level', 'initial_header_level',
+                      'compact_simple', 'compact_p', 'compact_field_list',
+                      'topic_classes', 'in_sidebar', 'in_footnote_list',
+                      'in_docinfo', 'protect_literal_text', 'line_block_nest',
+                      'in_mailto')
+    """Attributes the translation of the contents depends on."""
+
+    fragment_settings = ('attribution', 'cloak_email_addresses',
+                         'compact_field_lists', 'compact_lists',
+                         'file_insertion_enabled', 'footnote_backlinks',
+                         'footnote_references', 'language_code',
+                         'math_output', 'table_style')
+    """Settings the translation of the contents depends on."""
+
+    row_methods = ('visit_row', 'depart_row', 'visit_entry', 'depart_entry',
+                   'visit_paragraph', 'depart_paragraph', 'visit_Text')
+    """Methods `write_rows` does the work of."""
+
     # non-ascii [\n\r\t] non-ascii
     __RGX = re.compile(r'([^!-~])[\n\r\t]+([^!-~])')
-    # non-ascii [\s]* <End-of-TEXT>
-    __RGX1 = re.compile(r'([^!-~])[\s]*$')
-    # <Beginning-of-TEXT> [\s]* non-ascii
-    __RGX2 = re.compile(r'^[\s]*([^!-~])')
 
     def __init__(self, document):
         #super(HTMLTranslator, self).__init__(document)
@@ -303,7 +537,6 @@ class HTMLTranslator(nodes.NodeVisitor):
         # author, date, etc.
         self.docinfo = []
         self.body = []
-        self.fragment = []
         self.body_suffix = ['</body>\n</html>\n']
         self.section_level = 0
         self.initial_header_level = int(settings.initial_header_level)
@@ -331,12 +564,39 @@ class HTMLTranslator(nodes.NodeVisitor):
         self.html_head = [self.content_type] # charset not interpolated
         self.html_title = []
         self.html_subtitle = []
-        self.html_body = []
         self.in_document_title = 0   # len(self.body) or 0
         self.in_mailto = False
         self.math_header = []
+        self.head_complete = False
         self.protect_literal_text = False
         self.line_block_nest = 0
+        self.paragraph = None
+        # the last text in the paragraph ended with a non-ASCII character:
+        self.after_non_ascii = False
+        # (list, start, end) of its trailing whitespace, see `paragraph_text`:
+        self.held_space = None
+        # results of `simple_lists`, see `is_simple_list`:
+        self.simple_lists = {}
+        # `parallel.Sections` translating the top-level sections:
+        self.sections = None
+        # id(element): (key, len(self.body)) of the fragments to be cached:
+        self.fragments = None
+        if settings.fragment_cache:
+            self.fragments = {}
+            self.fragment_prefix = repr(
+                [self.__class__.__name__]
+                + [getattr(settings, name, None)
+                   for name in self.fragment_settings])
+
+    @property
+    def fragment(self):
+        """The "naked" body."""
+        return self.body
+
+    @property
+    def html_body(self):
+        return (self.body_prefix[1:] + self.body_pre_docinfo + self.docinfo
+                + self.body + self.body_suffix[:-1])
 
     def astext(self):
         return ''.join(self.head_prefix + self.head
@@ -348,15 +608,14 @@ class HTMLTranslator(nodes.NodeVisitor):
         """Encode special characters in `text` & return."""
         # Use only named entities known in HTML
         # other characters are automatically encoded "by number" if required.
-        text = unicode(text)
-        return text.translate({
-            ord('&'): u'&amp;',
-            ord('<'): u'&lt;',
-            ord('"'): u'&quot;',
-            ord('>'): u'&gt;',
-            ord('@'): u'&#64;', # may thwart some address harvesters
-            # TODO: convert non-breaking space only if needed?
-            0xa0: u'&nbsp;'}) # non-breaking space
+        if type(text) is not unicode:
+            text = unicode(text)
+        if self.special_characters.search(text) is None:
+            return text
+        for char, entity in self.special_entities:
+            if char in text:
+                text = text.replace(char, entity)
+        return text
 
     def cloak_mailto(self, uri):
         """Try to hide a mailto: URL from harvesters."""
@@ -376,8 +635,11 @@ class HTMLTranslator(nodes.NodeVisitor):
     def attval(self, text,
                whitespace=re.compile('[\n\r\t\v\f]')):
         """Cleanse, HTML encode, and return attribute value text."""
-        encoded = self.encode(whitespace.sub(' ', text))
-        if self.in_mailto and self.settings.cloak_email_addresses:
+        if whitespace.search(text):
+            text = whitespace.sub(' ', text)
+        encoded = self.encode(text)
+        if (self.in_mailto and self.settings.cloak_email_addresses
+            and ('%40' in encoded or '.' in encoded)):
             # Cloak at-signs ("%40") and periods with HTML entities.
             encoded = encoded.replace('%40', '&#37;&#52;&#48;')
             encoded = encoded.replace('.', '&#46;')
@@ -385,17 +647,42 @@ class HTMLTranslator(nodes.NodeVisitor):
 
     def stylesheet_call(self, path):
         """Return code to reference or embed stylesheet file `path`"""
+        if self.settings.asset_dir and os.path.isfile(path):
+            from htmlwriter.output import stylesheet_asset
+            try:
+                asset = stylesheet_asset(path, self.settings.asset_dir,
+                                         self.settings.minify)
+            except (IOError, OSError) as err:
+                msg = u"Cannot copy stylesheet '%s' to '%s': %s." % (
+                    path, self.settings.asset_dir, SafeString(err.strerror))
+                self.document.reporter.error(msg)
+                return '<--- %s --->\n' % msg
+            # the link changes with the stylesheet:
+            self.settings.record_dependencies.add(path)
+            record_output(self.settings, asset)
+            return self.stylesheet_link % self.encode(
+                utils.relative_path(self.settings._destination, asset))
         if self.settings.embed_stylesheet:
             try:
-                content = docutils.io.FileInput(source_path=path,
-                                                encoding='utf-8').read()
+                st = os.stat(path)
+                key = (self.embedded_stylesheet, path,
+                       st.st_mtime, st.st_size, self.settings.minify)
+                style = stylesheet_cache.get(key)
+                if style is None:
+                    content = docutils.io.FileInput(source_path=path,
+                                                    encoding='utf-8').read()
+                    if self.settings.minify:
+                        from htmlwriter.output import minify_css
+                        content = minify_css(content)
+                    style = self.embedded_stylesheet % content
+                    stylesheet_cache.set(key, style)
                 self.settings.record_dependencies.add(path)
-            except IOError as err:
+            except (IOError, OSError) as err:
                 msg = u"Cannot embed stylesheet '%s': %s." % (
                                 path, SafeString(err.strerror))
                 self.document.reporter.error(msg)
                 return '<--- %s --->\n' % msg
-            return self.embedded_stylesheet % content
+            return style
         # else link to style file:
         if self.settings.stylesheet_path:
             # adapt path relative to output (cf. config.html#stylesheet-path)
@@ -407,29 +694,45 @@ class HTMLTranslator(nodes.NodeVisitor):
         Construct and return a start tag given a node (id & class attributes
         are extracted), tag name, and optional attributes.
         """
+        if not (node.get('ids') or node.get('classes')):
+            # fast path: a constant tag, at most with a CLASS attribute
+            names = tuple(attributes)
+            if names in ((), ('CLASS',), ('class',)):
+                key = (tagname, suffix, self.lang_attribute,
+                       names and attributes[names[0]])
+                tag = starttag_cache.get(key)
+                if tag is None:
+                    tag = self.format_starttag(node, tagname, suffix, empty,
+                                               attributes)
+                    if len(starttag_cache) < starttag_cache_size:
+                        starttag_cache[key] = tag
+                return tag
+        return self.format_starttag(node, tagname, suffix, empty, attributes)
+
+    def format_starttag(self, node, tagname, suffix, empty, attributes):
         tagname = tagname.lower()
         prefix = []
         atts = {}
-        ids = []
         for (name, value) in attributes.items():
             atts[name.lower()] = value
-        classes = []
-        languages = []
-        # unify class arguments and move language specification
-        for cls in node.get('classes', []) + atts.pop('class', '').split() :
-            if cls.startswith('language-'):
-                languages.append(cls[9:])
-            elif cls.strip() and cls not in classes:
-                classes.append(cls)
-        if languages:
-            atts[self.lang_attribute] = languages[0]
-        if classes:
-            atts['class'] = ' '.join(classes)
+        classes = node.get('classes')
+        if classes or 'class' in atts:
+            # unify class arguments and move language specification
+            unified = []
+            languages = []
+            for cls in (classes or []) + atts.pop('class', '').split():
+                if cls.startswith('language-'):
+                    languages.append(cls[9:])
+                elif cls.strip() and cls not in unified:
+                    unified.append(cls)
+            if languages:
+                atts[self.lang_attribute] = languages[0]
+            if unified:
+                atts['class'] = ' '.join(unified)
         assert 'id' not in atts
-        ids.extend(node.get('ids', []))
+        ids = node.get('ids', [])
         if 'ids' in atts:
-            ids.extend(atts['ids'])
-            del atts['ids']
+            ids = ids + list(atts.pop('ids'))
         if ids:
             atts['id'] = ids[0]
             for id in ids[1:]:
@@ -448,14 +751,12 @@ class HTMLTranslator(nodes.NodeVisitor):
         parts = [tagname]
         for name, value in sorted(atts.items()):
             if value is None:
-                parts.append(name.lower())
+                parts.append(name)
+            elif isinstance(value, list):
+                parts.append('%s="%s"' % (name, self.attval(' '.join(value))))
             else:
-                if isinstance(value, list):
-                    vals = self.attval(' '.join(value))
-                else:
-                    vals = value
-                parts.append('%s="%s"' % (name.lower(), vals))
-        return ''.join(prefix) + '<%s>' % (' '.join(parts),) + suffix
+                parts.append('%s="%s"' % (name, value))
+        return ''.join(prefix) + '<%s>' % ' '.join(parts) + suffix
 
     def emptytag(self, node, tagname, suffix='\n', **attributes):
         """Construct and return an XML-compatible empty tag."""
@@ -474,7 +775,18 @@ class HTMLTranslator(nodes.NodeVisitor):
         child['classes'].append(class_)
 
     def visit_Text(self, node):
-        text = node.astext()
+        if self.paragraph is None:
+            self.append_text(node.astext())
+            return
+        text, space = self.paragraph_text(node)
+        self.append_text(text)
+        if space:
+            start = len(self.body)
+            self.append_text(space)
+            self.held_space = (self.body, start, len(self.body))
+
+    def append_text(self, text):
+        """Append the encoded `text` to the body."""
         encoded = self.encode(text)
         if self.protect_literal_text or self.line_block_nest:
             # moved here from base class's visit_literal to support
@@ -571,13 +883,22 @@ class HTMLTranslator(nodes.NodeVisitor):
 
     def check_simple_list(self, node):
         """Check for a simple list that can be rendered compactly."""
-        visitor = SimpleListChecker(self.document)
-        try:
-            node.walk(visitor)
-        except nodes.NodeFound:
-            return None
-        else:
+        if self.is_simple_list(node):
             return 1
+        return None
+
+    def is_simple_list(self, node):
+        """
+        Return True if `SimpleListChecker` finds `node` simple.
+
+        The results for `node` and all elements inside it are computed in
+        one pass, so nested lists are not checked again.
+        """
+        try:
+            return self.simple_lists[id(node)]
+        except KeyError:
+            self.simple_lists.update(simple_lists(node))
+            return self.simple_lists[id(node)]
 
     # Compact lists
     # ------------
@@ -605,13 +926,7 @@ class HTMLTranslator(nodes.NodeVisitor):
         if (self.topic_classes == ['contents']): # TODO: self.in_contents
             return True
         # check the list items:
-        visitor = SimpleListChecker(self.document)
-        try:
-            node.walk(visitor)
-        except nodes.NodeFound:
-            return False
-        else:
-            return True
+        return self.is_simple_list(node)
 
     def visit_bullet_list(self, node):
         atts = {}
@@ -810,7 +1125,86 @@ class HTMLTranslator(nodes.NodeVisitor):
         self.head.append('<title>%s</title>\n'
                          % self.encode(node.get('title', '')))
 
-    def depart_document(self, node):
+    def start_streaming(self, stream):
+        """
+        Pass the body to `stream` while the document is traversed.  The
+        head parts are completed and written when the first element
+        following the document title, meta data, decoration and docinfo
+        is reached.
+        """
+        self.stream = stream
+        self.dispatch_visit = self.dispatch_prologue_visit
+
+    def dispatch_prologue_visit(self, node):
+        if (node.parent is self.document
+            and not isinstance(node, self.prologue_classes)):
+            if self.document.next_node(
+                    lambda n: isinstance(n, (nodes.math, nodes.math_block))):
+                self.set_math_header()
+            self.complete_head(self.document)
+            self.stream.write_head(self)
+            self.flush_body()
+            del self.dispatch_visit
+            self.dispatch_departure = self.dispatch_streaming_departure
+        type(self).dispatch_visit(self, node)
+
+    def dispatch_streaming_departure(self, node):
+        type(self).dispatch_departure(self, node)
+        if len(self.body) >= self.stream_chunk_size:
+            self.flush_body()
+
+    def flush_body(self):
+        body = self.body
+        if self.held_space and self.held_space[0] is body:
+            # keep the whitespace that may still be blanked, see
+            # `paragraph_text`:
+            start, end = self.held_space[1:]
+            self.stream.write_body(body[:start])
+            del body[:start]
+            self.held_space = (body, 0, end - start)
+        else:
+            self.stream.write_body(body)
+            del body[:]
+        if self.fragments:
+            self.fragments.clear()  # their start is gone
+
+    def dispatch_visit(self, node):
+        if self.sections is not None and node is self.sections.first:
+            sections, self.sections = self.sections, None
+            sections.write(self)
+        nodes.NodeVisitor.dispatch_visit(self, node)
+        if (self.fragments is not None
+            and isinstance(node, self.fragment_classes)):
+            self.visit_fragment(node)
+
+    def dispatch_departure(self, node):
+        if self.fragments:
+            fragment = self.fragments.pop(id(node), None)
+            if fragment:
+                key, start = fragment
+                fragment_cache.set(key, ''.join(self.body[start:]))
+        nodes.NodeVisitor.dispatch_departure(self, node)
+
+    def visit_fragment(self, node):
+        """
+        Called after the element `node` was visited: append its translated
+        contents from `fragment_cache` and skip them, or remember where
+        they start so that `dispatch_departure` can add them to the cache.
+        The element itself is visited and departed as usual.
+        """
+        digest = fragment_digest(node)
+        if digest is None:
+            return
+        key = (self.fragment_prefix, digest, repr(
+            [getattr(self, name) for name in self.fragment_state]))
+        html = fragment_cache.get(key)
+        if html is not None:
+            self.body.append(html)
+            raise nodes.SkipChildren
+        self.fragments[id(node)] = (key, len(self.body))
+
+    def complete_head(self, node):
+        """Add the parts of the head that depend on the whole document."""
         self.head_prefix.extend([self.doctype,
                                  self.head_prefix_template %
                                  {'lang': self.settings.language_code}])
@@ -826,10 +1220,11 @@ class HTMLTranslator(nodes.NodeVisitor):
         self.html_head.extend(self.head[1:])
         self.body_prefix.append(self.starttag(node, 'div', CLASS='document'))
         self.body_suffix.insert(0, '</div>\n')
-        self.fragment.extend(self.body) # self.fragment is the "naked" body
-        self.html_body.extend(self.body_prefix[1:] + self.body_pre_docinfo
-                              + self.docinfo + self.body
-                              + self.body_suffix[:-1])
+        self.head_complete = True
+
+    def depart_document(self, node):
+        if not self.head_complete:
+            self.complete_head(node)
         assert not self.context, 'len(context) = %s' % len(self.context)
 
     def visit_emphasis(self, node):
@@ -1022,6 +1417,11 @@ class HTMLTranslator(nodes.NodeVisitor):
         self.header.extend(header)
         del self.body[start:]
 
+    def image_size(self, path):
+        """Return the (width, height) of image file `path` or None."""
+        from htmlwriter import imagesize
+        return imagesize.get_size(path, self.settings.image_size_cache)
+
     def get_value_with_unit(self, value):
         match = re.match(r'([0-9.]+)(\S*)$', value)
         assert match
@@ -1046,20 +1446,15 @@ class HTMLTranslator(nodes.NodeVisitor):
                 units[att_name] = (value, unit)
 
         if 'scale' in node:
-            if (PIL and not ('width' in atts and 'height' in atts)
+            if (not ('width' in atts and 'height' in atts)
                 and self.settings.file_insertion_enabled):
                 imagepath = url2pathname(uri)
-                try:
-                    img = PIL.Image.open(
-                            imagepath.encode(sys.getfilesystemencoding()))
-                except (IOError, UnicodeEncodeError):
-                    pass # TODO: warn?
-                else:
+                size = self.image_size(imagepath)
+                if size: # TODO: warn if None?
                     self.settings.record_dependencies.add(
                         imagepath.replace('\\', '/'))
-                    atts['width'] = str(img.size[0])
-                    atts['height'] = str(img.size[1])
-                    del img
+                    atts['width'] = str(size[0])
+                    atts['height'] = str(size[1])
 
             scale = float(node['scale'])
 
@@ -1252,11 +1647,7 @@ class HTMLTranslator(nodes.NodeVisitor):
         # As there is no native HTML math support, we provide alternatives:
         # LaTeX and MathJax math_output modes simply wrap the content,
         # HTML and MathML math_output modes also convert the math_code.
-        if self.math_output not in ('mathml', 'html', 'mathjax', 'latex'):
-            self.document.reporter.error(
-                'math-output format "%s" not supported '
-                'falling back to "latex"'% self.math_output)
-            self.math_output = 'latex'
+        self.set_math_header()
         #
         # HTML container
         tags = {# math_output: (block, inline, class-arguments)
@@ -1276,7 +1667,9 @@ class HTMLTranslator(nodes.NodeVisitor):
                    }
         wrapper = wrappers[self.math_output][math_env != '']
         # get and wrap content
-        math_code = node.astext().translate(unichar2tex.uni2tex_table)
+        from docutils.utils.math import unichar2tex
+        math_code = self.paragraph_astext(node).translate(
+            unichar2tex.uni2tex_table)
         if wrapper and math_env:
             math_code = wrapper % (math_env, math_code, math_env)
         elif wrapper:
@@ -1284,23 +1677,11 @@ class HTMLTranslator(nodes.NodeVisitor):
         # settings and conversion
         if self.math_output in ('latex', 'mathjax'):
             math_code = self.encode(math_code)
-        if self.math_output == 'mathjax' and not self.math_header:
-            if self.math_output_options:
-                self.mathjax_url = self.math_output_options[0]
-            self.math_header = [self.mathjax_script % self.mathjax_url]
-        elif self.math_output == 'html':
-            if self.math_output_options and not self.math_header:
-                self.math_header = [self.stylesheet_call(
-                    utils.find_file_in_dirs(s, self.settings.stylesheet_dirs))
-                    for s in self.math_output_options[0].split(',')]
-            # TODO: fix display mode in matrices and fractions
-            math2html.DocumentParameters.displaymode = (math_env != '')
-            math_code = math2html.math2html(math_code)
+        if self.math_output == 'html':
+            math_code = self.convert_math(math_code, math_env)
         elif self.math_output == 'mathml':
-            self.doctype = self.doctype_mathml
             try:
-                mathml_tree = parse_latex_math(math_code, inline=not(math_env))
-                math_code = ''.join(mathml_tree.xml())
+                math_code = self.convert_math(math_code, math_env)
             except SyntaxError as err:
                 err_node = self.document.reporter.error(err, base_node=node)
                 self.visit_system_message(err_node)
@@ -1331,7 +1712,57 @@ class HTMLTranslator(nodes.NodeVisitor):
     def depart_math(self, node):
         pass # never reached
 
+    def convert_math(self, math_code, math_env):
+        """
+        Convert LaTeX `math_code` to HTML or MathML (depending on the math
+        output format).  Raise SyntaxError if the conversion to MathML
+        fails.
+        """
+        key = (self.math_output, math_env, math_code)
+        converted = math_cache.get(key)
+        if converted is not None:
+            return converted
+        if self.math_output == 'html':
+            from docutils.utils.math import math2html
+            # math2html keeps its state in class attributes:
+            with math2html_lock:
+                # TODO: fix display mode in matrices and fractions
+                math2html.DocumentParameters.displaymode = (math_env != '')
+                converted = math2html.math2html(math_code)
+        else:
+            from docutils.utils.math.latex2mathml import parse_latex_math
+            mathml_tree = parse_latex_math(math_code, inline=not(math_env))
+            converted = ''.join(mathml_tree.xml())
+        # conversion errors are not cached:
+        math_cache.set(key, converted)
+        return converted
+
+    def set_math_header(self):
+        """
+        Check the math output format and set the header and doctype
+        required by the math in the document.
+        """
+        if self.math_output not in ('mathml', 'html', 'mathjax', 'latex'):
+            self.document.reporter.error(
+                'math-output format "%s" not supported '
+                'falling back to "latex"'% self.math_output)
+            self.math_output = 'latex'
+        if self.math_header:
+            return
+        if self.math_output == 'mathjax':
+            mathjax_url = self.mathjax_url
+            if self.math_output_options:
+                mathjax_url = self.math_output_options[0]
+            self.math_header = [self.mathjax_script % mathjax_url]
+        elif self.math_output == 'html' and self.math_output_options:
+            self.math_header = [self.stylesheet_call(
+                utils.find_file_in_dirs(s, self.settings.stylesheet_dirs))
+                for s in self.math_output_options[0].split(',')]
+        elif self.math_output == 'mathml':
+            self.doctype = self.doctype_mathml
+
     def visit_math_block(self, node):
+        from docutils.utils.math import pick_math_environment
         math_env = pick_math_environment(node.astext())
         self.visit_math(node, math_env=math_env)
 
@@ -1397,33 +1828,54 @@ class HTMLTranslator(nodes.NodeVisitor):
     def depart_organization(self, node):
         self.depart_docinfo_item()
 
-    def strip_spaces_between_uchars(self, para):
-        # modify text inside Text node
-        for node in para.traverse():
-            if isinstance(node, docutils.nodes.Text):
-                newtext = node.astext()
-                newtext = self.__RGX.sub(r"\1\2", newtext)
-                node.parent.replace(node, docutils.nodes.Text(newtext))
-
-    def strip_spaces_around_uchars_paragraph_children(self, para):
-        # modify texts over 2 nodes
-        # (paragraph node can have childre of Inline (reference, etc) nodes)
-        prev_textnode = docutils.nodes.Text("")
-        for node in para.traverse():
-            new_textnode = None
-            if isinstance(node, docutils.nodes.Text):
-                prevtext = prev_textnode.astext()
-                newtext = node.astext()
-                if self.__RGX1.search(prevtext) and self.__RGX2.search(newtext):
-                    new_prev_textnode = docutils.nodes.Text(
-                        prev_textnode.astext().rstrip())
-                    new_textnode = Text(newtext.lstrip())
-                    prev_textnode.parent.replace(prev_textnode,
-                                                 new_prev_textnode)
-                    node.parent.replace(node, new_textnode)
-                    new_prev_textnode.parent = prev_textnode.parent
-                    new_textnode.parent = node.parent
-                prev_textnode = new_textnode if new_textnode else node
+    # Whitespace around non-ASCII characters
+    # ---------------------------------------
+    #
+    # Line breaks between non-ASCII (e.g. Japanese) characters are removed
+    # from paragraph text, as are spaces between a text ending and the next
+    # text starting with non-ASCII characters or whitespace.  The text is
+    # changed as it is written, the document tree is left alone: the
+    # whitespace at the end of a text is written separately and blanked
+    # when the next text turns out to start with such a character.
+
+    def paragraph_text(self, node):
+        """
+        Return the text of Text `node` inside the current paragraph,
+        without its trailing whitespace if it ends with a non-ASCII
+        character, and that whitespace.  The caller writes both and
+        records the position of the whitespace in `held_space`.
+        """
+        text = node.astext()
+        if '\n' in text or '\t' in text or '\r' in text:
+            text = self.__RGX.sub(r"\1\2", text)
+        # Characters outside "!" to "~" (including all whitespace) count
+        # as non-ASCII here.
+        if self.after_non_ascii:
+            self.after_non_ascii = False
+            if text and not '!' <= text[0] <= '~':
+                text = text.lstrip()
+                if self.held_space:
+                    texts, start, end = self.held_space
+                    texts[start:end] = [''] * (end - start)
+            self.held_space = None
+        if text and not '!' <= text[-1] <= '~':
+            self.after_non_ascii = True
+            stripped = text.rstrip()
+            return stripped, text[len(stripped):]
+        return text, ''
+
+    def paragraph_astext(self, node):
+        """Return the text of element `node` like `node.astext()`."""
+        if self.paragraph is None:
+            return node.astext()
+        texts = []
+        for child in node.children:
+            text, space = self.paragraph_text(child)
+            texts.append(text)
+            if space:
+                texts.append(space)
+                self.held_space = (texts, len(texts) - 1, len(texts))
+        return ''.join(texts)
 
     # Do not omit <p> tags
     # --------------------
@@ -1441,11 +1893,14 @@ class HTMLTranslator(nodes.NodeVisitor):
     # TODO: omit paragraph tags in simple table cells?
 
     def visit_paragraph(self, node):
-        self.strip_spaces_between_uchars(node)
-        self.strip_spaces_around_uchars_paragraph_children(node)
+        self.paragraph = node
+        self.after_non_ascii = False
+        self.held_space = None
         self.body.append(self.starttag(node, 'p', ''))
 
     def depart_paragraph(self, node):
+        self.paragraph = None
+        self.held_space = None
         self.body.append('</p>')
         if not (isinstance(node.parent, (nodes.list_item, nodes.entry)) and
                 (len(node.parent) == 1)):
@@ -1468,9 +1923,11 @@ class HTMLTranslator(nodes.NodeVisitor):
             t = isinstance(node.parent, nodes.TextElement) and 'span' or 'div'
             if node['classes']:
                 self.body.append(self.starttag(node, t, suffix=''))
-            self.body.append(node.astext())
+            self.body.append(self.paragraph_astext(node))
             if node['classes']:
                 self.body.append('</%s>' % t)
+        else:
+            self.paragraph_astext(node)  # keep track of paragraph text
         # Keep non-HTML raw text out of output:
         raise nodes.SkipNode
 
@@ -1537,6 +1994,67 @@ class HTMLTranslator(nodes.NodeVisitor):
     def depart_row(self, node):
         self.body.append('</tr>\n')
 
+    def writes_rows(self):
+        """
+        Return True if `write_rows` may be used, i.e. none of the
+        `row_methods` is overridden in a subclass or in the instance
+        (e.g. by ``--profile-translator``).
+        """
+        for name in self.row_methods:
+            method = getattr(self.__class__, name)
+            if (name in self.__dict__ or getattr(method, '__func__', method)
+                is not HTMLTranslator.__dict__[name]):
+                return False
+        return True
+
+    def write_rows(self, node):
+        """
+        Write the rows of the thead or tbody `node` like `visit_row` and
+        `visit_entry` would do, with the stub columns looked up once.
+        Cells holding a paragraph of plain text are written directly, the
+        contents of the other cells are visited.
+        """
+        body = self.body
+        stubs = node.parent.stubs
+        head = isinstance(node, nodes.thead)
+        starttag = self.starttag
+        simple = not (self.protect_literal_text or self.line_block_nest)
+        streaming = self.stream is not None and self.head_complete
+        for row in node:
+            body.append(starttag(row, 'tr', ''))
+            column = 0
+            for entry in row:
+                if head:
+                    classes = 'head stub' if stubs[column] else 'head'
+                else:
+                    classes = 'stub' if stubs[column] else None
+                tagname = 'th' if classes else 'td'
+                column += 1
+                atts = {}
+                if classes:
+                    atts['class'] = classes
+                if 'morerows' in entry:
+                    atts['rowspan'] = entry['morerows'] + 1
+                if 'morecols' in entry:
+                    atts['colspan'] = entry['morecols'] + 1
+                    column += entry['morecols']
+                body.append(starttag(entry, tagname, '', **atts))
+                text = simple and len(entry) == 1 and plain_paragraph(entry[0])
+                if text:
+                    # see `visit_paragraph`, `visit_Text`, `depart_paragraph`
+                    self.paragraph = entry[0]
+                    self.after_non_ascii = False
+                    body.append('<p>%s</p>' % self.encode(
+                        ''.join(self.paragraph_text(text))))
+                    self.paragraph = None
+                else:
+                    for child in entry.children[:]:
+                        child.walkabout(self)
+                body.append('</%s>\n' % tagname)
+            body.append('</tr>\n')
+            if streaming and len(body) >= self.stream_chunk_size:
+                self.flush_body()
+
     def visit_rubric(self, node):
         self.body.append(self.starttag(node, 'p', '', CLASS='rubric'))
 
@@ -1675,6 +2193,9 @@ class HTMLTranslator(nodes.NodeVisitor):
         self.write_colspecs()
         self.body.append(self.context.pop()) # '</colgroup>\n' or ''
         self.body.append(self.starttag(node, 'tbody'))
+        if self.writes_rows():
+            self.write_rows(node)
+            raise nodes.SkipChildren
 
     def depart_tbody(self, node):
         self.body.append('</tbody>\n')
@@ -1705,6 +2226,9 @@ class HTMLTranslator(nodes.NodeVisitor):
         # There may or may not be a <thead>; this is for <tbody> to use:
         self.context.append('')
         self.body.append(self.starttag(node, 'thead'))
+        if self.writes_rows():
+            self.write_rows(node)
+            raise nodes.SkipChildren
 
     def depart_thead(self, node):
         self.body.append('</thead>\n')
@@ -1808,16 +2332,7 @@ class SimpleListChecker(nodes.GenericNodeVisitor):
         raise nodes.NodeFound
 
     def visit_list_item(self, node):
-        children = [child for child in node.children
-                    if not isinstance(child, nodes.Invisible)]
-        if (children and isinstance(children[0], nodes.paragraph)
-            and (isinstance(children[-1], nodes.bullet_list) or
-                 isinstance(children[-1], nodes.enumerated_list) or
-                 isinstance(children[-1], nodes.field_list))):
-            children.pop()
-        if len(children) <= 1:
-            return
-        else:
+        if not is_simple_item(node):
             raise nodes.NodeFound
 
     def pass_node(self, node):
@@ -1866,3 +2381,404 @@ class SimpleListChecker(nodes.GenericNodeVisitor):
     visit_substitution_definition = ignore_node
     visit_target = ignore_node
     visit_pending = ignore_node
+
+
+def plain_paragraph(node):
+    """
+    Return the Text node of `node` if it is a paragraph holding only
+    plain text, else None.
+    """
+    if (node.__class__ is nodes.paragraph and len(node) == 1
+        and isinstance(node[0], nodes.Text)
+        and not (node['ids'] or node['classes'])):
+        return node[0]
+    return None
+
+
+def is_simple_item(node):
+    """
+    Return True if the list item `node` contains nothing but a single
+    paragraph, a list, or a paragraph followed by a list.
+    """
+    children = [child for child in node.children
+                if not isinstance(child, nodes.Invisible)]
+    if (children and isinstance(children[0], nodes.paragraph)
+        and (isinstance(children[-1], nodes.bullet_list) or
+             isinstance(children[-1], nodes.enumerated_list) or
+             isinstance(children[-1], nodes.field_list))):
+        children.pop()
+    return len(children) <= 1
+
+
+# How `SimpleListChecker` handles a node class, by class name:
+_simple_list_kinds = {}
+
+def simple_list_kind(node):
+    """
+    Return 'ignore', 'pass', 'item' or 'fail' for the `SimpleListChecker`
+    method handling `node`.
+    """
+    name = node.__class__.__name__
+    try:
+        return _simple_list_kinds[name]
+    except KeyError:
+        visit = getattr(SimpleListChecker, 'visit_' + name, None)
+        kind = {'ignore_node': 'ignore', 'pass_node': 'pass',
+                'visit_list_item': 'item'}.get(
+                    getattr(visit, '__name__', None), 'fail')
+        _simple_list_kinds[name] = kind
+        return kind
+
+def simple_lists(node):
+    """
+    Return a dictionary mapping the id() of `node` and of the elements
+    inside it to True if walking them with `SimpleListChecker` would not
+    raise `nodes.NodeFound`.
+
+    The results are computed bottom-up in a single traversal.
+    """
+    results = {}
+    def check(node):
+        kind = simple_list_kind(node)
+        if kind == 'ignore':
+            return True
+        simple = (kind == 'pass' or kind == 'item' and is_simple_item(node))
+        for child in node.children:
+            # no short cut: nested lists need their own result
+            simple = check(child) and simple
+        results[id(node)] = simple
+        return simple
+    results[id(node)] = check(node)
+    return results
+
+
+def fragment_digest(node):
+    """
+    Return a digest of the class, attributes and text of `node` and its
+    descendants, or None if their translation depends on more than that:
+    math (math header), scaled images (image files) and unresolved
+    citation references (names of the document).
+
+    As the ids are part of the digest, contents with ids are only reused
+    in documents using the same ids.
+    """
+    import hashlib
+    digest = hashlib.sha1()
+    def add(node):
+        if isinstance(node, nodes.Text):
+            text = node.encode('utf-8')
+            digest.update(('T%d:' % len(text)).encode('ascii'))
+            digest.update(text)
+            return True
+        if (isinstance(node, (nodes.math, nodes.math_block))
+            or isinstance(node, nodes.image) and 'scale' in node
+            or isinstance(node, nodes.citation_reference)
+            and 'refid' not in node):
+            return False
+        digest.update(('<%s %r>' % (node.__class__.__name__, sorted(
+            node.attributes.items()))).encode('utf-8'))
+        for child in node.children:
+            if not add(child):
+                return False
+        digest.update(b'/')
+        return True
+    if add(node):
+        return digest.hexdigest()
+    return None
+
+
+class LRUCache(object):
+
+    """
+    A thread-safe mapping of bounded size.  When full, the least recently
+    used entry is dropped.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()  # least recently used first
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            if len(self.data) >= self.maxsize:
+                self.data.popitem(last=False)
+            self.data[key] = value
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = self.misses = 0
+
+
+def save_cache(cache, path):
+    """Call ``cache.save(path)``, reporting failures on stderr."""
+    try:
+        cache.save(path)
+    except (IOError, OSError) as err:
+        sys.stderr.write('Cannot write cache file %s: %s\n' % (path, err))
+
+
+def save_at_exit(cache, path):
+    """
+    Save `cache` to `path` with `save_cache` when the process exits, also
+    in worker processes of `multiprocessing` (which skip the `atexit`
+    handlers).
+    """
+    from multiprocessing import util
+    util.Finalize(None, save_cache, (cache, path), exitpriority=0)
+
+
+class MathCache(LRUCache):
+
+    """
+    Converted math, keyed by (math output, math environment, LaTeX code).
+    The cache can be loaded from and saved to a JSON file, which is
+    discarded if it was written with another version of Docutils.
+    """
+
+    def __init__(self, maxsize):
+        LRUCache.__init__(self, maxsize)
+        self.loaded = set()
+        self.dirty = False
+
+    def set(self, key, value):
+        LRUCache.set(self, key, value)
+        self.dirty = True
+
+    def read(self, path):
+        """
+        Return the (key, converted math) pairs of the cache file `path`,
+        least recently used first.
+        """
+        try:
+            with io.open(path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+        except (IOError, OSError, ValueError):
+            return []
+        if (not isinstance(content, dict)
+            or content.get('docutils') != docutils.__version__):
+            return []  # converted by another version
+        return [((output, env, code), converted) for output, env, code,
+                converted in content.get('entries', [])[-self.maxsize:]]
+
+    def load(self, path):
+        """
+        Add the entries of the cache file `path` (once per process) and
+        save the cache to it when the process exits.
+        """
+        if path in self.loaded:
+            return
+        self.loaded.add(path)
+        entries = self.read(path)
+        with self.lock:
+            for key, converted in entries:
+                self.data.setdefault(key, converted)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+        save_at_exit(self, path)
+
+    def save(self, path):
+        """
+        Write the cache to `path` if it changed, keeping the entries
+        written by other processes in the meantime.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            data = self.data.copy()
+            self.dirty = False
+        entries = [list(key) + [converted]
+                   for key, converted in self.read(path) if key not in data]
+        entries.extend(list(key) + [converted]
+                       for key, converted in data.items())
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with io.open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(unicode(json.dumps(
+                {'docutils': docutils.__version__,
+                 'entries': entries[-self.maxsize:]})))
+        replace(tmp_path, path)
+
+
+# Serializes the use of the process-wide state of `math2html`:
+math2html_lock = threading.Lock()
+
+# Converted math, see `HTMLTranslator.visit_math`:
+math_cache = MathCache(4096)
+
+# Start tags of nodes without ids and classes, keyed by
+# (tag name, suffix, language attribute, CLASS argument):
+starttag_cache = {}
+starttag_cache_size = 1024
+
+# Translated contents of elements, see `HTMLTranslator.visit_fragment`:
+fragment_cache = LRUCache(256)
+
+# Embedded stylesheets (``<style>`` blocks), keyed by (template, path,
+# modification time, size) of the stylesheet file and the minify setting:
+stylesheet_cache = LRUCache(32)
+
+
+class Template(object):
+
+    """
+    A template file, read once and reused while the file is unchanged.
+    `names` is the set of the placeholders used in the template.
+    """
+
+    placeholder = re.compile(r'%(?:%|\(([^)]*)\))')
+
+    def __init__(self, text):
+        self.text = text
+        self.names = frozenset(
+            name for name in self.placeholder.findall(text) if name)
+
+    @classmethod
+    def load(cls, path):
+        st = os.stat(path)
+        key = (cls, path, st.st_mtime, st.st_size)
+        template = template_cache.get(key)
+        if template is None:
+            with io.open(path, 'r', encoding='utf-8') as f:
+                template = cls(f.read())
+            template_cache.set(key, template)
+        return template
+
+    def split(self, name):
+        """
+        Return the template texts before and after the placeholder
+        "%%(name)s", or None unless the template uses part `name` exactly
+        once in this form.
+        """
+        matches = [match for match in self.placeholder.finditer(self.text)
+                   if match.group(1) == name]
+        if len(matches) != 1:
+            return None
+        start, end = matches[0].span()
+        if self.text[end:end+1] != 's':
+            return None
+        return self.text[:start], self.text[end+1:]
+
+
+class DocumentParts(MutableMapping):
+
+    """
+    The `Writer.parts` of a document that is not written.  The parts are
+    joined from the part lists of the writer on first access; "whole"
+    applies the template.  Otherwise `Writer.assemble_parts` turns it into
+    a dictionary.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.names = ['whole'] + list(writer.visitor_attributes)
+        self.values = {}
+
+    def __getitem__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            if name not in self.names:
+                raise
+        if name == 'whole':
+            value = self.writer.apply_template()
+        elif name == 'fragment':
+            value = self['body']
+        else:
+            value = ''.join(getattr(self.writer, name))
+        if self.writer.document.settings.minify and name != 'fragment':
+            from htmlwriter.output import minify_html
+            value = minify_html(value)
+        self.values[name] = value
+        return value
+
+    def __setitem__(self, name, value):
+        if name not in self.names:
+            self.names.append(name)
+        self.values[name] = value
+
+    def __delitem__(self, name):
+        self.names.remove(name)
+        self.values.pop(name, None)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class OutputStream(object):
+
+    """
+    The output of a streamed translation: the template text `head` is
+    written when the translator completed the head parts, then the body
+    as it is generated, finally the template text `tail`.
+    """
+
+    def __init__(self, writer, destination, head, tail, gzip_output=None):
+        self.writer = writer
+        self.destination = destination
+        self.gzip_output = gzip_output
+        self.head = head
+        self.tail = tail
+        self.head_written = False
+        self.minifier = None
+        if writer.document.settings.minify:
+            from htmlwriter.output import Minifier
+            self.minifier = Minifier()
+        self.newlines = ''
+        """Trailing newlines of the body so far (stripped at the end)."""
+
+    def substitute(self, text, visitor):
+        names = Template(text).names
+        return text % self.writer.interpolation_dict(names, visitor)
+
+    def write(self, text):
+        if self.minifier:
+            text = self.minifier.feed(text)
+        self.output(text)
+
+    def output(self, text):
+        self.destination.write(text)
+        if self.gzip_output:
+            self.gzip_output.write(text)
+
+    def write_head(self, visitor):
+        self.write(self.substitute(self.head, visitor))
+        self.head_written = True
+
+    def write_body(self, chunks):
+        data = ''.join(chunks)
+        stripped = data.rstrip('\n')
+        if stripped:
+            self.write(self.newlines + stripped)
+            self.newlines = data[len(stripped):]
+        else:
+            self.newlines += data
+
+    def close(self, visitor):
+        """Write the rest of the output of the finished `visitor`."""
+        if not self.head_written:
+            self.write_head(visitor)
+        self.write_body(visitor.body)
+        self.write(self.substitute(self.tail, visitor))
+        if self.minifier:
+            self.output(self.minifier.close())
+
+
+# Compiled templates, keyed by (class, path, modification time, size):
+template_cache = LRUCache(16)
@@ -0,0 +1,149 @@
+# Author: IGARASHI Masanao <syoux2@gmail.com>
+# Copyright: This module has been placed in the public domain.
+
+"""
+Convert documents from asyncio code without blocking the event loop
+(Python 3.7 or later)::
+
+    from htmlwriter import aio
+
+    parts = await aio.render_parts(source, {'math_output': 'MathJax'})
+    pages = await aio.render_many(sources, parts=['body'])
+
+The conversion, including the stylesheet and image files it reads, runs
+in an executor: threads by default, or processes with
+``Renderer(executor='process')``, which also keeps large documents from
+slowing down the conversion of others (the parser and the writer hold the
+GIL).  At most `Renderer.limit` conversions are submitted at a time, the
+others wait in order of arrival, so a burst of requests does not pile up
+in the executor.  Cancelling a waiting call withdraws its conversion;
+a conversion that is already running completes in the background and
+its result is dropped.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import weakref
+from docutils import utils
+from htmlwriter import pool
+
+
+def render(source, settings, source_path, destination_path, names):
+    """
+    Convert `source` and return the parts in `names` (default: all) as a
+    dictionary.  Runs in the executor.
+    """
+    parts = pool.convert(source, settings, source_path, destination_path)
+    return dict((name, parts[name]) for name in names or parts
+                if name in parts)
+
+
+def release(loop, semaphore):
+    """Release `semaphore` in the thread of `loop` (unless it is closed)."""
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        pass
+
+
+class Renderer(object):
+
+    """
+    Convert documents in an executor.  `executor` is 'thread', 'process'
+    or a `concurrent.futures.Executor`; `limit` is the maximum number of
+    conversions submitted at a time (default: the number of CPUs).
+    """
+
+    def __init__(self, settings_overrides=None, executor='thread',
+                 limit=None):
+        self.limit = limit or os.cpu_count() or 1
+        if executor == 'thread':
+            executor = concurrent.futures.ThreadPoolExecutor(self.limit)
+            self.own_executor = True
+        elif executor == 'process':
+            executor = concurrent.futures.ProcessPoolExecutor(self.limit)
+            self.own_executor = True
+        else:
+            self.own_executor = False
+        self.executor = executor
+        self.settings = pool.get_settings(settings_overrides)
+        self.semaphores = weakref.WeakKeyDictionary()
+        """Mapping event loop -> semaphore limiting the conversions."""
+
+    async def render_parts(self, source, settings_overrides=None,
+                           source_path=None, destination_path=None,
+                           parts=None):
+        """
+        Convert the reStructuredText string `source` and return the
+        dictionary of the `Writer.parts` in `parts` (default: all).
+        `settings_overrides` update the settings of the renderer.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self.semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self.semaphores[loop] = asyncio.Semaphore(self.limit)
+        settings = self.settings.copy()
+        for name, value in (settings_overrides or {}).items():
+            setattr(settings, name, value)
+        settings.record_dependencies = utils.DependencyList()
+        settings.parallel_sections = 0  # executor threads must not fork
+        await semaphore.acquire()
+        try:
+            future = self.executor.submit(render, source, settings,
+                                          source_path, destination_path,
+                                          parts)
+        except BaseException:
+            semaphore.release()
+            raise
+        # keep the slot until the conversion is done, even if cancelled:
+        future.add_done_callback(
+            lambda future: release(loop, semaphore))
+        return await asyncio.wrap_future(future)
+
+    async def render_many(self, sources, settings_overrides=None,
+                          parts=None, return_exceptions=False):
+        """
+        Convert the strings in `sources` and return the list of parts
+        dictionaries in the order of `sources`.  With `return_exceptions`,
+        failed conversions return their exception instead of cancelling
+        the others.
+        """
+        return await asyncio.gather(
+            *[self.render_parts(source, settings_overrides, parts=parts)
+              for source in sources],
+            return_exceptions=return_exceptions)
+
+    def close(self):
+        """Shut down the executor if it was created by the renderer."""
+        if self.own_executor:
+            self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+default_renderer = None
+
+
+def get_renderer():
+    """Return the renderer used by `render_parts` and `render_many`."""
+    global default_renderer
+    if default_renderer is None:
+        default_renderer = Renderer()
+    return default_renderer
+
+
+async def render_parts(source, settings_overrides=None, **kwargs):
+    """`Renderer.render_parts` with a shared thread executor."""
+    return await get_renderer().render_parts(source, settings_overrides,
+                                             **kwargs)
+
+
+async def render_many(sources, settings_overrides=None, **kwargs):
+    """`Renderer.render_many` with a shared thread executor."""
+    return await get_renderer().render_many(sources, settings_overrides,
+                                            **kwargs)
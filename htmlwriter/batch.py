@@ -0,0 +1,215 @@
+# Author: IGARASHI Masanao <syoux2@gmail.com>
+# Copyright: This module has been placed in the public domain.
+
+"""
+Convert whole source trees, using a pool of worker processes.
+
+Every worker imports Docutils and the writer once and then converts many
+documents with a private copy of the command line settings.
+"""
+
+import errno
+import multiprocessing
+import os
+import os.path
+import sys
+import traceback
+from docutils import utils
+from docutils.core import publish_file
+import htmlwriter
+from htmlwriter.manifest import Manifest, settings_digest
+
+# Settings of the current worker process (see `init_worker`).
+_settings = None
+
+default_manifest = '.rst2htmlr-manifest.json'
+
+# Settings that do not influence the generated HTML:
+frontend_settings = ('_source', '_destination', '_config_files', '_outputs',
+                     'record_dependencies', 'traceback', 'batch', 'jobs',
+                     'source_suffix', 'manifest', 'force', 'serve', 'socket',
+                     'watch', 'stream_output', 'profile_translator',
+                     'profile_translator_file', 'fragment_cache',
+                     'parallel_sections')
+
+
+def makedirs(path):
+    """Create directory `path` and its parents unless they exist."""
+    try:
+        os.makedirs(path)
+    except OSError as err:
+        if err.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def walk(source_dir, destination_dir):
+    """
+    Yield (dirpath, filenames) for every directory of the source tree,
+    skipping hidden directories and the output tree itself.
+    """
+    destination_root = os.path.abspath(destination_dir)
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames[:] = sorted(
+            d for d in dirnames if not d.startswith('.') and
+            os.path.abspath(os.path.join(dirpath, d)) != destination_root)
+        yield dirpath, filenames
+
+
+def find_sources(source_dir, destination_dir, suffixes):
+    """
+    Yield a (source, destination) pair for every file below `source_dir`
+    whose name ends with one of `suffixes`.  The destination mirrors the
+    relative path of the source below `destination_dir`.
+    """
+    suffixes = tuple(suffixes)
+    for dirpath, filenames in walk(source_dir, destination_dir):
+        for name in sorted(filenames):
+            if not name.endswith(suffixes):
+                continue
+            source = os.path.join(dirpath, name)
+            relative = os.path.relpath(os.path.splitext(source)[0],
+                                       source_dir)
+            yield source, os.path.join(destination_dir, relative + '.html')
+
+
+def base_settings(settings):
+    """
+    Return a copy of the command line `settings` that can be sent to
+    the worker processes.
+    """
+    settings = settings.copy()
+    settings.record_dependencies = None
+    settings._source = settings._destination = None
+    return settings
+
+
+def init_worker(settings):
+    global _settings
+    _settings = settings
+
+
+def render_file(job):
+    """
+    Convert the source file to the destination file of `job`.
+
+    Return a (source, destination, dependencies, outputs, error) tuple;
+    `outputs` are the files written in addition to the destination (e.g.
+    the ``--precompress`` copy), `error` is None on success, else a
+    message describing the failure.
+    """
+    source, destination = job
+    settings = _settings.copy()
+    settings._source = source
+    settings._destination = destination
+    settings.record_dependencies = utils.DependencyList()
+    settings._outputs = []
+    # let exceptions propagate, they are reported by the caller:
+    settings.traceback = True
+    try:
+        makedirs(os.path.dirname(destination) or os.curdir)
+        publish_file(source_path=source, destination_path=destination,
+                     writer=htmlwriter.Writer(), settings=settings)
+    except (Exception, SystemExit) as err:
+        if _settings.traceback:
+            message = traceback.format_exc()
+        else:
+            message = '%s: %s' % (err.__class__.__name__, err)
+        return source, destination, [], [], message
+    return (source, destination, settings.record_dependencies.list,
+            settings._outputs, None)
+
+
+def save_caches(settings):
+    """Write the caches used by the conversions (if they changed)."""
+    if settings.image_size_cache:
+        from htmlwriter import imagesize
+        htmlwriter.save_cache(imagesize.cache, settings.image_size_cache)
+    if settings.math_cache:
+        htmlwriter.save_cache(htmlwriter.math_cache, settings.math_cache)
+
+
+def render_files(jobs, settings, processes):
+    """
+    Convert the (source, destination) pairs of `jobs` with `processes`
+    worker processes.  Yield the results of `render_file` in completion
+    order.  The caches are written once per worker process.
+    """
+    settings = base_settings(settings)
+    if processes <= 1 or len(jobs) <= 1:
+        init_worker(settings)
+        for job in jobs:
+            yield render_file(job)
+        save_caches(settings)
+        return
+    pool = multiprocessing.Pool(processes, init_worker, (settings,))
+    try:
+        # large chunks amortize the inter-process communication,
+        # small ones balance the load between the workers:
+        chunksize = max(1, min(32, len(jobs) // (processes * 8)))
+        for result in pool.imap_unordered(render_file, jobs, chunksize):
+            yield result
+        pool.close()
+        pool.join()  # let the workers exit normally and save their caches
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def build(settings):
+    """
+    Convert the source tree ``settings._source`` to ``settings._destination``.
+    Documents that are up to date according to the build manifest are
+    skipped.  Failures are reported without stopping the run.
+    Return the exit status.
+    """
+    source_dir = settings._source
+    destination_dir = settings._destination
+    if not (source_dir and os.path.isdir(source_dir)):
+        sys.stderr.write('--batch: SOURCE must be a directory.\n')
+        return 2
+    if not destination_dir:
+        sys.stderr.write('--batch: DESTINATION directory required.\n')
+        return 2
+    jobs = list(find_sources(source_dir, destination_dir,
+                             settings.source_suffix))
+    manifest = None
+    if settings.manifest != '':
+        makedirs(destination_dir)
+        manifest = Manifest(settings.manifest or
+                            os.path.join(destination_dir, default_manifest))
+        manifest.prune(destination for source, destination in jobs)
+    digest = settings_digest(settings, frontend_settings)
+    if manifest and not settings.force:
+        stale = []
+        for source, destination in jobs:
+            if manifest.is_current(destination, digest):
+                settings.record_dependencies.add(
+                    *manifest.dependencies(destination))
+            else:
+                stale.append((source, destination))
+    else:
+        stale = jobs
+    processes = settings.jobs or multiprocessing.cpu_count()
+    failures = 0
+    try:
+        for source, destination, dependencies, outputs, error in render_files(
+                stale, settings, min(processes, len(stale))):
+            if error:
+                failures += 1
+                sys.stderr.write('%s: %s\n' % (source, error.rstrip()))
+                if manifest:
+                    manifest.discard(destination)
+                continue
+            settings.record_dependencies.add(*dependencies)
+            if manifest:
+                manifest.record(destination, digest,
+                                (source, settings.template), dependencies,
+                                outputs)
+    finally:
+        if manifest:
+            manifest.save()
+    if failures:
+        sys.stderr.write('%d of %d documents failed.\n'
+                         % (failures, len(jobs)))
+        return 1
+    return 0
@@ -0,0 +1,213 @@
+# Author: IGARASHI Masanao <syoux2@gmail.com>
+# Copyright: This module has been placed in the public domain.
+
+"""
+Determine image dimensions without decoding the image.
+
+The size of PNG, GIF, JPEG, WebP and SVG images is read from the file
+header; the Python Imaging Library is only imported (on first use) as a
+fallback for other formats.  Results are cached in memory and optionally in
+a JSON file, keyed by path, modification time and file size.  The file
+is written once, when the process exits.
+"""
+
+import io
+import json
+import os
+import re
+import struct
+import sys
+import threading
+from xml.etree import ElementTree
+from htmlwriter import replace, save_at_exit
+
+PIL = None  # the Python Imaging Library, see `import_pil`
+
+
+def png_size(f, head):
+    if head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+
+def gif_size(f, head):
+    return struct.unpack('<HH', head[6:10])
+
+def jpeg_size(f, head):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        while marker[1:2] == b'\xff':  # fill bytes
+            marker = marker[1:] + f.read(1)
+        if len(marker) < 2 or marker[0:1] != b'\xff':
+            return None
+        code = ord(marker[1:2])
+        if code in (0xd9, 0xda):
+            return None  # end of image or start of scan: no frame header
+        if code in (0xd8, 0x01) or 0xd0 <= code <= 0xd7:
+            continue  # markers without payload
+        length = struct.unpack('>H', f.read(2))[0]
+        # start of frame markers (but not DHT, JPG and DAC):
+        if 0xc0 <= code <= 0xcf and code not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack('>xHH', f.read(5))
+            return width, height
+        f.seek(length - 2, 1)
+
+def webp_size(f, head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3fff, height & 0x3fff
+    if chunk == b'VP8L':
+        bits = struct.unpack('<I', head[21:25])[0]
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b'VP8X':
+        width, height = struct.unpack('<II', head[24:27] + b'\0'
+                                      + head[27:30] + b'\0')
+        return width + 1, height + 1
+
+svg_length = re.compile(r'\s*([0-9.]+)\s*(px)?\s*$')
+
+def svg_size(f, head):
+    f.seek(0)
+    for event, element in ElementTree.iterparse(f, ('start',)):
+        break  # only the root element is needed
+    else:
+        return None
+    width = svg_length.match(element.get('width', ''))
+    height = svg_length.match(element.get('height', ''))
+    if width and height:
+        return (int(round(float(width.group(1)))),
+                int(round(float(height.group(1)))))
+    viewbox = element.get('viewBox', '').replace(',', ' ').split()
+    if len(viewbox) == 4:
+        return (int(round(float(viewbox[2]))),
+                int(round(float(viewbox[3]))))
+
+def import_pil():
+    """Import the Python Imaging Library on first use; return it or False."""
+    global PIL
+    if PIL is None:
+        try:
+            import PIL.Image
+        except ImportError:
+            try:  # sometimes PIL modules are put in PYTHONPATH's root
+                import Image
+                class PIL(object): pass  # dummy wrapper
+                PIL.Image = Image
+            except ImportError:
+                PIL = False
+    return PIL
+
+def pil_size(path):
+    try:
+        img = PIL.Image.open(path.encode(sys.getfilesystemencoding()))
+    except (IOError, UnicodeEncodeError):
+        return None
+    return img.size
+
+
+def probe(path):
+    """
+    Return the (width, height) of the image file `path`, or None if
+    it cannot be determined.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            try:
+                if head.startswith(b'\x89PNG\r\n\x1a\n'):
+                    return png_size(f, head)
+                if head[:6] in (b'GIF87a', b'GIF89a'):
+                    return gif_size(f, head)
+                if head.startswith(b'\xff\xd8'):
+                    return jpeg_size(f, head)
+                if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                    return webp_size(f, head)
+                if (path.lower().endswith(('.svg', '.svgz'))
+                    or b'<svg' in head):
+                    return svg_size(f, head)
+            except (struct.error, ValueError, ElementTree.ParseError):
+                return None
+    except (IOError, OSError):
+        return None
+    if import_pil():
+        return pil_size(path)
+    return None
+
+
+class SizeCache(object):
+
+    """
+    Image sizes keyed by path, modification time and file size,
+    optionally loaded from and saved to JSON files.
+    """
+
+    def __init__(self):
+        self.sizes = {}
+        """Mapping path -> [mtime, file size, width, height]."""
+        self.loaded = set()
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self, cache_file):
+        """
+        Merge the cache file `cache_file` (once per process) and save the
+        cache to it when the process exits.
+        """
+        with self.lock:
+            if cache_file in self.loaded:
+                return
+            self.loaded.add(cache_file)
+            self.merge(cache_file)
+        save_at_exit(self, cache_file)
+
+    def merge(self, cache_file):
+        try:
+            with io.open(cache_file, 'r', encoding='utf-8') as f:
+                sizes = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        for path, entry in sizes.items():
+            self.sizes.setdefault(path, entry)
+
+    def save(self, cache_file):
+        """Write the cache to `cache_file` if there are new entries."""
+        with self.lock:
+            if not self.dirty:
+                return
+            # keep entries written by other processes in the meantime:
+            self.merge(cache_file)
+            tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+            with io.open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(u'%s' % json.dumps(self.sizes, sort_keys=True))
+            replace(tmp_file, cache_file)
+            self.dirty = False
+
+    def get_size(self, path):
+        """Return the (width, height) of image `path` or None."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        entry = self.sizes.get(path)
+        if entry and entry[:2] == [st.st_mtime, st.st_size]:
+            return tuple(entry[2:]) if entry[2] is not None else None
+        size = probe(path)
+        width, height = size or (None, None)
+        with self.lock:
+            self.sizes[path] = [st.st_mtime, st.st_size, width, height]
+            self.dirty = True
+        return size
+
+
+# Process-wide cache of image sizes:
+cache = SizeCache()
+
+
+def get_size(path, cache_file=None):
+    """
+    Return the (width, height) of image `path` or None.  If `cache_file`
+    is given, it is loaded on first use.
+    """
+    if cache_file:
+        cache.load(cache_file)
+    return cache.get_size(path)
@@ -0,0 +1,147 @@
+# Author: IGARASHI Masanao <syoux2@gmail.com>
+# Copyright: This module has been placed in the public domain.
+
+"""
+Build manifest for incremental batch conversion.
+
+The manifest remembers, for every output file, the content hashes of the
+files it was generated from (source, template and recorded dependencies),
+a hash of the effective settings and the other files written with it
+(e.g. the ``--precompress`` copy).  An output whose inputs did not change
+since the last build and whose files all exist can be skipped.
+"""
+
+try:
+    unicode
+except NameError:
+    unicode = str
+
+import hashlib
+import io
+import json
+import os
+import os.path
+from htmlwriter import replace
+
+
+class Manifest(object):
+
+    """
+    On-disk record of the inputs of generated files.
+
+    File hashes are cached together with the modification time and size
+    of the file, so unchanged files are only stat()ed, not read again.
+    """
+
+    version = 2
+
+    def __init__(self, path):
+        self.path = path
+        self.outputs = {}
+        """
+        Mapping output path -> {'settings', 'inputs', 'dependencies',
+        'outputs'}.
+        """
+        self.files = {}
+        """Mapping input path -> [mtime, size, digest] of the last build."""
+        self.digests = {}
+        """Digests computed during this run."""
+        try:
+            with io.open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if data.get('version') == self.version:
+            self.outputs = data['outputs']
+            self.files = data['files']
+
+    def save(self):
+        data = {'version': self.version,
+                'outputs': self.outputs,
+                'files': dict((path, self.files[path])
+                              for path in self.referenced_files()
+                              if path in self.files)}
+        tmp_path = self.path + '.tmp'
+        with io.open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(unicode(json.dumps(data, sort_keys=True,
+                                       separators=(',', ':'))))
+        replace(tmp_path, self.path)
+
+    def referenced_files(self):
+        files = set()
+        for entry in self.outputs.values():
+            files.update(entry['inputs'])
+        return files
+
+    def digest(self, path):
+        """Return the content hash of file `path` (None if missing)."""
+        if path in self.digests:
+            return self.digests[path]
+        try:
+            st = os.stat(path)
+        except OSError:
+            digest = None
+        else:
+            cached = self.files.get(path)
+            if cached and cached[:2] == [st.st_mtime, st.st_size]:
+                digest = cached[2]
+            else:
+                with open(path, 'rb') as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()
+                self.files[path] = [st.st_mtime, st.st_size, digest]
+        self.digests[path] = digest
+        return digest
+
+    def is_current(self, output, settings_digest):
+        """
+        Return True if `output` and the files written with it exist and
+        none of its inputs changed since it was recorded.
+        """
+        entry = self.outputs.get(output)
+        if (entry is None or entry['settings'] != settings_digest
+            or not os.path.exists(output)):
+            return False
+        for path in entry['outputs']:
+            if not os.path.exists(path):
+                return False
+        for path, digest in entry['inputs'].items():
+            if self.digest(path) != digest:
+                return False
+        return True
+
+    def dependencies(self, output):
+        return self.outputs[output]['dependencies']
+
+    def record(self, output, settings_digest, inputs, dependencies,
+               outputs=()):
+        """
+        Record that `output` and the files in `outputs` were generated
+        from `inputs`.
+        """
+        paths = list(inputs) + list(dependencies)
+        self.outputs[output] = {
+            'settings': settings_digest,
+            'inputs': dict((path, self.digest(path)) for path in paths),
+            'dependencies': list(dependencies),
+            'outputs': list(outputs)}
+
+    def discard(self, output):
+        self.outputs.pop(output, None)
+
+    def prune(self, outputs):
+        """Forget all outputs not in `outputs`."""
+        outputs = set(outputs)
+        for output in list(self.outputs):
+            if output not in outputs:
+                del self.outputs[output]
+
+
+def settings_digest(settings, ignore=()):
+    """
+    Return a hash of the setting values in `settings` that may influence
+    the output.  Names in `ignore` are skipped.
+    """
+    items = sorted((name, repr(value))
+                   for name, value in settings.__dict__.items()
+                   if name not in ignore)
+    return hashlib.sha1(repr(items).encode('utf-8')).hexdigest()
@@ -0,0 +1,205 @@
+# Author: IGARASHI Masanao <syoux2@gmail.com>
+# Copyright: This module has been placed in the public domain.
+
+"""
+Post-processing of the output, imported when a setting needs it:
+minification (``--minify``), gzip-compressed copies of the output files
+(``--precompress``) and content-hashed stylesheet copies
+(``--asset-dir``).
+"""
+
+import hashlib
+import os
+import re
+import zlib
+from htmlwriter import LRUCache, replace
+
+
+class Minifier(object):
+
+    """
+    Remove the whitespace between two tags if one of them belongs to a
+    block element (or is a comment or declaration), except in `pre`,
+    `textarea`, `script` and `style` elements.  Whitespace next to text
+    and between inline elements is significant and kept.
+
+    The HTML is passed to `feed` in chunks of any size; the text from the
+    last tag (or an unfinished preformatted element) on is held back until
+    the next chunk or `close`.
+    """
+
+    block_tags = frozenset([
+        'address', 'article', 'aside', 'blockquote', 'body', 'caption',
+        'col', 'colgroup', 'dd', 'details', 'div', 'dl', 'dt', 'fieldset',
+        'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4',
+        'h5', 'h6', 'head', 'header', 'hr', 'html', 'li', 'link', 'main',
+        'meta', 'nav', 'ol', 'p', 'pre', 'script', 'section', 'style',
+        'summary', 'table', 'tbody', 'td', 'textarea', 'tfoot', 'th',
+        'thead', 'title', 'tr', 'ul'])
+
+    # start tag and contents of a preformatted element
+    # | a tag followed by whitespace and a tag:
+    pattern = re.compile(
+        r'<(?:(pre|textarea|script|style)\b.*?(?=</\1\s*>)'
+        r'|(!--.*?-->|[!?][^>]*>|(/?)([a-zA-Z][a-zA-Z0-9]*)[^>]*>)\s+'
+        r'(?=<(?:/?([a-zA-Z][a-zA-Z0-9]*))?))', re.S | re.I)
+
+    preformatted_start = re.compile(r'<(pre|textarea|script|style)\b', re.I)
+
+    def __init__(self):
+        self.rest = ''
+
+    def feed(self, text):
+        return self.minify(self.rest + text, False)
+
+    def close(self):
+        return self.minify(self.rest, True)
+
+    def minify(self, text, final):
+        end = len(text)
+        if not final:
+            end = max(text.rfind('<'), 0)
+            last = None
+            for last in self.preformatted_start.finditer(text):
+                pass
+            if (last and last.start() < end
+                and text.find('</' + last.group(1), last.end()) < 0):
+                end = last.start()  # wait for the end of the element
+        output = []
+        start = 0
+        block_tags = self.block_tags
+        for match in self.pattern.finditer(text):
+            if match.end() > end:
+                if match.start() < end:
+                    end = match.start()
+                break
+            if match.group(2) is None:
+                continue  # preformatted element
+            if match.group(4):
+                block = match.group(4).lower() in block_tags
+            else:
+                block = True  # comment or declaration
+            if not block:
+                block = (match.group(5) is None
+                         or match.group(5).lower() in block_tags)
+            if block:
+                output.append(text[start:match.end(2)])
+                start = match.end()
+        output.append(text[start:end])
+        self.rest = text[end:]
+        return ''.join(output)
+
+
+def minify_html(text):
+    """Return `text` minified like `Minifier` does."""
+    minifier = Minifier()
+    return minifier.feed(text) + minifier.close()
+
+
+css_comments = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')'
+                          r'|/\*.*?\*/', re.S)
+css_spaces = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')'
+                        r'|\s*([{};,>])\s*|(:)\s+|\s+')
+
+
+def minify_css(css):
+    """Remove the comments and the needless whitespace of `css`."""
+    css = css_comments.sub(lambda match: match.group(1) or '', css)
+    css = css_spaces.sub(lambda match: match.group(1) or match.group(2)
+                         or match.group(3) or ' ', css)
+    return css.replace(';}', '}').strip()
+
+
+def stylesheet_asset(path, directory, minify=False):
+    """
+    Return the path of the copy of stylesheet file `path` in `directory`,
+    named after the file and a hash of its (minified) content.  The copy
+    is written if it does not exist yet.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime, st.st_size,
+           os.path.abspath(directory), minify)
+    asset = asset_cache.get(key)
+    if asset is not None and os.path.exists(asset):
+        return asset
+    with open(path, 'rb') as f:
+        data = f.read()
+    if minify:
+        data = minify_css(data.decode('utf-8')).encode('utf-8')
+    name, ext = os.path.splitext(os.path.basename(path))
+    asset = os.path.join(directory, '%s.%s%s' % (
+        name, hashlib.sha1(data).hexdigest()[:8], ext))
+    if not os.path.exists(asset):
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # created concurrently?
+                if not os.path.isdir(directory):
+                    raise
+        tmp_path = '%s.%d.tmp' % (asset, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        replace(tmp_path, asset)
+    asset_cache.set(key, asset)
+    return asset
+
+
+# Stylesheet copies written by `stylesheet_asset`, keyed by
+# (path, modification time, size, directory, minify):
+asset_cache = LRUCache(32)
+
+
+class GzipOutput(object):
+
+    """
+    A gzip-compressed copy of the output file `destination`, written to
+    ``<destination path>.gz`` as the output is written.  The copy is only
+    kept if the output has at least `min_size` bytes, else a copy left by
+    an earlier run is removed.
+    """
+
+    def __init__(self, destination, level, min_size):
+        self.destination = destination
+        self.path = destination.destination_path + '.gz'
+        self.tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        self.min_size = min_size
+        # gzip format without file name and time: the same output gives
+        # the same file
+        self.compressor = zlib.compressobj(min(level, 9), zlib.DEFLATED,
+                                           16 + zlib.MAX_WBITS)
+        self.file = None
+        self.size = 0
+
+    def write(self, data):
+        """Add the text `data` written to the destination file."""
+        if not isinstance(data, bytes):
+            if os.linesep != '\n':
+                data = data.replace('\n', os.linesep)
+            data = self.destination.encode(data)
+        self.size += len(data)
+        self.write_compressed(self.compressor.compress(data))
+
+    def write_compressed(self, data):
+        if data:
+            if self.file is None:
+                self.file = open(self.tmp_path, 'wb')
+            self.file.write(data)
+
+    def close(self):
+        """Complete the copy; return True if it is kept."""
+        self.write_compressed(self.compressor.flush())
+        if self.file is not None:
+            self.file.close()
+        if self.size >= self.min_size and self.file is not None:
+            replace(self.tmp_path, self.path)
+            return True
+        for path in (self.tmp_path, self.path):
+            if os.path.exists(path):
+                os.remove(path)
+        return False
+
+    def abort(self):
+        """Remove the incomplete copy."""
+        if self.file is not None:
+            self.file.close()
+            os.remove(self.tmp_path)
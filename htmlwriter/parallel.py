@@ -0,0 +1,159 @@
+# Author: IGARASHI Masanao <syoux2@gmail.com>
+# Copyright: This module has been placed in the public domain.
+
+"""
+Translate the top-level sections of a document in worker processes (the
+``--parallel-sections`` setting).
+
+The document children from the first top-level section on (sections and
+transitions) are split into chunks of consecutive children, which are
+translated by a pool of forked processes while the translator of the
+document handles the title, docinfo and the other elements preceding them.
+When the translator reaches the first section, `Sections.write` appends
+the HTML of the chunks in document order.
+
+A chunk is translated starting with the translator state of the document
+level (see `HTMLTranslator.fragment_state`).  If the translator is in
+another state when the chunk is reached, or the chunk ends in another
+state, the chunk is translated again in the translator; the output is the
+one of a serial translation in any case.  The math header and the recorded
+dependencies of the workers are added in document order, too.
+
+Workers inherit the document by forking, so nothing but the output is
+transferred.  On platforms without ``fork``, in daemonic processes and in
+processes running other threads (which may hold locks, e.g.
+`htmlwriter.math2html_lock`, that would never be released in the workers)
+the document is translated serially.
+"""
+
+import itertools
+import os
+import multiprocessing
+import threading
+from docutils import nodes, utils
+
+chunks_per_process = 8
+"""Chunks per worker process, they are distributed to idle workers."""
+
+jobs = {}
+"""Mapping job number -> (translator class, document, chunks, state)."""
+
+jobs_lock = threading.Lock()
+
+job_numbers = itertools.count()
+
+
+def start(translator, processes):
+    """
+    Start translating the top-level sections of the document of
+    `translator` with `processes` worker processes and return the
+    `Sections`, or None if the document is translated serially.
+    """
+    if (not hasattr(os, 'fork') or processes < 2
+        or multiprocessing.current_process().daemon
+        or threading.active_count() > 1
+        or not isinstance(threading.current_thread(), threading._MainThread)):
+        return None  # daemonic (e.g. batch) workers must not fork
+    document = translator.document
+    for index, child in enumerate(document.children):
+        if isinstance(child, nodes.section):
+            break
+    else:
+        return None
+    tail = document.children[index:]
+    count = min(len(tail), processes * chunks_per_process)
+    if count < 2:
+        return None
+    size, rest = divmod(len(tail), count)
+    chunks = []
+    end = 0
+    for i in range(count):
+        begin, end = end, end + size + (i < rest)
+        chunks.append(tail[begin:end])
+    return Sections(translator, processes, chunks)
+
+
+def get_state(translator):
+    return [getattr(translator, name) for name in translator.fragment_state]
+
+
+def set_state(translator, state):
+    for name, value in zip(translator.fragment_state, state):
+        setattr(translator, name, value)
+
+
+def translate_chunk(job, index):
+    """
+    Translate chunk `index` of `job` in a worker process.  Return the HTML,
+    the translator state after the chunk, whether the chunk contains math
+    and the dependencies recorded while translating it.
+    """
+    translator_class, document, chunks, state = jobs[job]
+    # the recorded dependencies are written by the parent process:
+    document.settings.record_dependencies = utils.DependencyList()
+    translator = translator_class(document)
+    set_state(translator, state)
+    math = False
+    for node in chunks[index]:
+        node.walkabout(translator)
+        math = math or bool(node.next_node(
+            lambda n: isinstance(n, (nodes.math, nodes.math_block))))
+    return (u''.join(translator.body), get_state(translator), math,
+            document.settings.record_dependencies.list)
+
+
+class Sections(object):
+
+    def __init__(self, translator, processes, chunks):
+        self.chunks = chunks
+        self.first = chunks[0][0]
+        """The document child starting the first chunk."""
+        self.state = get_state(translator)
+        try:
+            context = multiprocessing.get_context('fork')
+        except AttributeError:  # Python 2 always forks
+            context = multiprocessing
+        dependencies = translator.settings.record_dependencies
+        if dependencies and dependencies.file:
+            dependencies.file.flush()  # else the workers write it again
+        with jobs_lock:
+            job = next(job_numbers)
+            jobs[job] = (translator.__class__, translator.document,
+                         chunks, self.state)
+            try:
+                self.pool = context.Pool(processes)
+            finally:
+                del jobs[job]
+        self.results = [self.pool.apply_async(translate_chunk, (job, index))
+                        for index in range(len(chunks))]
+        self.pool.close()
+
+    def write(self, translator):
+        """
+        Append the HTML of all chunks to the body of `translator` and skip
+        the remaining document children.
+        """
+        streaming = translator.stream is not None
+        try:
+            for chunk, result in zip(self.chunks, self.results):
+                html, state, math, dependencies = result.get()
+                if get_state(translator) != self.state or state != self.state:
+                    for node in chunk:
+                        node.walkabout(translator)
+                else:
+                    translator.body.append(html)
+                    if math:
+                        translator.set_math_header()
+                    if dependencies:
+                        translator.settings.record_dependencies.add(
+                            *dependencies)
+                if streaming and (len(translator.body)
+                                  >= translator.stream_chunk_size):
+                    translator.flush_body()
+        finally:
+            self.close()
+        raise nodes.SkipSiblings
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
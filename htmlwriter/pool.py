@@ -0,0 +1,80 @@
+# Author: IGARASHI Masanao <syoux2@gmail.com>
+# Copyright: This module has been placed in the public domain.
+
+"""
+Convert documents concurrently on a pool of threads.
+
+`HTMLTranslator` keeps all state of a document in the translator instance;
+the process-wide caches are locked and the process-wide state of
+``math2html`` is only used under `htmlwriter.math2html_lock`.  Several
+documents can therefore be converted at the same time in one process::
+
+    from htmlwriter import pool
+
+    settings = pool.get_settings({'math_output': 'MathML'})
+    for parts in pool.publish_parts_many(sources, settings, threads=8):
+        print(parts['body'])
+
+Each call works on a private copy of `settings`, so the settings object is
+only built (command line defaults, configuration files) once.
+"""
+
+from multiprocessing.pool import ThreadPool
+import docutils.io
+from docutils import utils
+from docutils.core import Publisher
+import htmlwriter
+
+
+def get_settings(settings_overrides=None):
+    """
+    Return the default settings of the reStructuredText parser and the
+    HTML writer, updated with the `settings_overrides` dictionary.
+    """
+    pub = Publisher(writer=htmlwriter.Writer())
+    pub.set_components('standalone', 'restructuredtext', 'html')
+    return pub.get_settings(**(settings_overrides or {}))
+
+
+def publish_parts(source, settings, source_path=None, destination_path=None):
+    """
+    Convert the reStructuredText string `source` and return the
+    `Writer.parts` dictionary.  `settings` (see `get_settings`) is not
+    modified.
+    """
+    settings = settings.copy()
+    settings.record_dependencies = utils.DependencyList()
+    settings.parallel_sections = 0  # threads must not fork
+    return dict(convert(source, settings, source_path, destination_path))
+
+
+def convert(source, settings, source_path=None, destination_path=None):
+    """
+    Convert the reStructuredText string `source` with `settings` (used
+    as is) and return the `Writer.parts` mapping.  Unlike
+    `docutils.core.publish_parts`, nothing is written, so the parts are
+    only joined and the template is only applied when they are used.
+    """
+    pub = Publisher(source_class=docutils.io.StringInput,
+                    destination_class=docutils.io.NullOutput,
+                    writer=htmlwriter.Writer(), settings=settings)
+    pub.set_components('standalone', 'restructuredtext', 'html')
+    pub.set_source(source, source_path)
+    pub.set_destination(destination_path=destination_path)
+    pub.publish()
+    return pub.writer.parts
+
+
+def publish_parts_many(sources, settings, threads=None):
+    """
+    Convert the strings in `sources` with `threads` threads (default:
+    the number of CPUs).  Return the list of parts dictionaries in the
+    order of `sources`.
+    """
+    pool = ThreadPool(threads)
+    try:
+        return pool.map(lambda source: publish_parts(source, settings),
+                        sources)
+    finally:
+        pool.close()
+        pool.join()
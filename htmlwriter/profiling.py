@@ -0,0 +1,113 @@
+# Author: IGARASHI Masanao <syoux2@gmail.com>
+# Copyright: This module has been placed in the public domain.
+
+"""
+Per-method profile of a `htmlwriter.HTMLTranslator` (the
+``--profile-translator`` setting).
+
+`instrument` replaces the ``visit_*`` and ``depart_*`` methods and the
+expensive helpers of one translator instance by wrappers recording the
+number of calls, the cumulative time, the own time (without the wrapped
+methods called from it) and the size of the output appended to ``body``.
+The translator class is not modified: translations without profile do not
+pay for it.
+"""
+
+import io
+import json
+import time
+
+try:
+    clock = time.perf_counter
+except AttributeError:  # Python 2
+    clock = time.time
+
+
+helpers = ('is_compactable', 'convert_math', 'image_size')
+"""Translator methods profiled in addition to the visit_/depart_ methods."""
+
+
+def output_size(parts):
+    """Return the UTF-8 encoded size of the strings in `parts`."""
+    return len(u''.join(parts).encode('utf-8'))
+
+
+class Profile(object):
+
+    def __init__(self, translator):
+        self.translator = translator
+        self.stats = {}
+        """Mapping method name -> [calls, cumulative time, own time, bytes]."""
+        self.stack = []
+        """[time, bytes] of the wrapped methods called by the running ones."""
+
+    def wrap(self, name, method):
+        stats = self.stats.setdefault(name, [0, 0.0, 0.0, 0])
+        stack = self.stack
+        translator = self.translator
+
+        def wrapper(*args, **kwargs):
+            start_length = len(translator.body)
+            nested = [0.0, 0]
+            stack.append(nested)
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                stack.pop()
+                # parts of body may have been moved elsewhere (document
+                # title, header, footer, streamed output):
+                size = output_size(translator.body[start_length:])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] += elapsed - nested[0]
+                stats[3] += max(0, size - nested[1])
+                if stack:
+                    stack[-1][0] += elapsed
+                    stack[-1][1] += size
+        return wrapper
+
+    def as_dict(self):
+        return dict((name, {'calls': calls, 'cumulative': cumulative,
+                            'self': own, 'bytes': size})
+                    for name, (calls, cumulative, own, size)
+                    in self.stats.items() if calls)
+
+    def table(self):
+        """Return the profile as text, sorted by decreasing own time."""
+        rows = sorted(((own, name, calls, cumulative, size)
+                       for name, (calls, cumulative, own, size)
+                       in self.stats.items() if calls), reverse=True)
+        lines = ['%-36s %8s %12s %12s %12s'
+                 % ('method', 'calls', 'cumulative', 'self', 'bytes')]
+        for own, name, calls, cumulative, size in rows:
+            lines.append('%-36s %8d %12.6f %12.6f %12d'
+                         % (name, calls, cumulative, own, size))
+        return '\n'.join(lines) + '\n'
+
+    def report(self, document):
+        """
+        Write the table to the warning stream of `document` and the JSON
+        report to the ``profile_translator_file`` setting, if given.
+        """
+        document.reporter.stream.write(
+            'Translator profile of %s:\n%s'
+            % (document.settings._source or '<string>', self.table()))
+        path = document.settings.profile_translator_file
+        if path:
+            with io.open(path, 'w', encoding='utf-8') as f:
+                f.write(u'%s' % json.dumps(
+                    {'source': document.settings._source,
+                     'methods': self.as_dict()}, indent=1, sort_keys=True))
+
+
+def instrument(translator):
+    """Profile the methods of `translator`; return the `Profile`."""
+    profile = Profile(translator)
+    for name in dir(type(translator)):
+        if name.startswith(('visit_', 'depart_')) or name in helpers:
+            method = getattr(translator, name)
+            if callable(method):
+                setattr(translator, name, profile.wrap(name, method))
+    return profile
@@ -12,16 +12,85 @@ try:
     locale.setlocale(locale.LC_ALL, '')
 except:
     pass
+import sys
+import docutils
+from docutils import frontend
 import htmlwriter
 
-def main():
-    from docutils.core import publish_cmdline, default_description
+
+class CommandLine(docutils.SettingsSpec):
+
+    """Settings of the ``rst2htmlr`` front end itself."""
+
+    settings_spec = (
+        'rst2htmlr Options',
+        None,
+        (('Convert every source file below the SOURCE directory and write '
+          'the HTML files to the same relative paths below the DESTINATION '
+          'directory.',
+          ['--batch'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
+         ('Number of worker processes used by --batch.  '
+          'Default is the number of CPUs.',
+          ['--jobs'],
+          {'metavar': '<n>', 'type': 'int',
+           'validator': frontend.validate_nonnegative_int}),
+         ('Comma separated list of file name suffixes of the sources '
+          'converted by --batch.  Default: ".rst,.txt"',
+          ['--source-suffix'],
+          {'metavar': '<suffix[,suffix,...]>',
+           'validator': frontend.validate_comma_separated_list,
+           'default': ['.rst', '.txt']}),
+         ('Build manifest used by --batch to skip documents whose source, '
+          'template, dependencies and settings did not change since the '
+          'last run.  Default: ".rst2htmlr-manifest.json" in the '
+          'DESTINATION directory.',
+          ['--manifest'],
+          {'metavar': '<file>'}),
+         ('Do not read or write a build manifest.',
+          ['--no-manifest'],
+          {'dest': 'manifest', 'action': 'store_const', 'const': ''}),
+         ('Convert all documents, even if the manifest lists them as '
+          'up to date.',
+          ['--force'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
+         ('Run as a render server: read JSON requests with source text and '
+          'setting overrides line by line and answer with the document '
+          'parts.  The other options set the defaults of every request.',
+          ['--serve'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
+         ('Unix domain socket used by --serve.  Default: stdin/stdout.',
+          ['--socket'],
+          {'metavar': '<path>'}),
+         ('Convert the SOURCE directory like --batch, then keep watching it '
+          'and convert again every document whose source or dependencies '
+          '(stylesheets, images, included files, template) change.',
+          ['--watch'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),))
+
+    config_section = 'rst2htmlr application'
+
+
+def main(argv=None):
+    from docutils.core import Publisher, default_description
 
     description = ('Generates HTML documents from standalone reStructuredText '
                    'sources.  ' + default_description)
 
-    publish_cmdline(writer=htmlwriter.Writer(), writer_name='html',
-                    description=description)
+    pub = Publisher(writer=htmlwriter.Writer())
+    pub.set_components('standalone', 'restructuredtext', 'html')
+    pub.process_command_line(argv, description=description,
+                             settings_spec=CommandLine())
+    if pub.settings.serve:
+        from htmlwriter import server
+        sys.exit(server.serve(pub.settings))
+    if pub.settings.watch:
+        from htmlwriter import watch
+        sys.exit(watch.watch(pub.settings))
+    if pub.settings.batch:
+        from htmlwriter import batch
+        sys.exit(batch.build(pub.settings))
+    pub.publish(enable_exit_status=True)
 
 if __name__ == '__main__':
     main()
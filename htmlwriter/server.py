@@ -0,0 +1,188 @@
+# Author: IGARASHI Masanao <syoux2@gmail.com>
+# Copyright: This module has been placed in the public domain.
+
+"""
+Long-lived render server.
+
+Requests and responses are JSON objects, one per line, exchanged over
+stdin/stdout or a Unix domain socket.  A request looks like ::
+
+    {"id": 1, "source": "Title\\n=====\\n",
+     "settings": {"math_output": "MathML"}}
+
+with optional "source_path" and "destination_path" members and an optional
+list of the wanted "parts" (default: all).  The response carries the same
+"id" and either the `Writer.parts` dictionary in "parts" (plus the system
+messages in "messages" and the recorded dependencies in "dependencies") or
+a description of the failure in "error".  Parts that are not requested are
+not assembled.
+
+A request may only override the settings in `request_settings`; settings
+naming files that are read or written (the template, stylesheets, caches,
+profile reports, included files) are fixed by the command line of the
+server.
+
+Docutils, the parser and the writer stay imported and the command line is
+parsed only once, so the cost of a request is the conversion itself.
+"""
+
+import io
+import json
+import os
+import signal
+import sys
+try:
+    import socketserver
+except ImportError:  # Python 2
+    import SocketServer as socketserver
+from docutils import utils
+from htmlwriter import pool
+from htmlwriter.batch import base_settings
+
+# Settings a request may override:
+request_settings = frozenset([
+    # general
+    'title', 'generator', 'datestamp', 'source_link', 'source_url',
+    'toc_backlinks', 'footnote_backlinks', 'sectnum_xform',
+    'strip_comments', 'strip_elements_with_classes', 'strip_classes',
+    'report_level', 'halt_level', 'language_code', 'id_prefix',
+    'auto_id_prefix', 'docinfo_xform', 'doctitle_xform',
+    'sectsubtitle_xform', 'smart_quotes', 'smartquotes_locales',
+    'syntax_highlight',
+    # reStructuredText parser
+    'pep_references', 'pep_base_url', 'rfc_references', 'rfc_base_url',
+    'tab_width', 'trim_footnote_reference_space',
+    'character_level_inline_markup',
+    # HTML writer
+    'initial_header_level', 'field_name_limit', 'option_limit',
+    'footnote_references', 'attribution', 'compact_lists',
+    'compact_field_lists', 'table_style', 'math_output', 'minify',
+    'xml_declaration', 'cloak_email_addresses'])
+
+
+def check_settings(overrides):
+    """
+    Raise ValueError unless a request may apply the settings `overrides`.
+    """
+    if not isinstance(overrides, dict):
+        raise ValueError('"settings" must be an object')
+    denied = sorted(set(overrides) - request_settings)
+    if denied:
+        raise ValueError('settings not allowed: %s' % ', '.join(denied))
+    math_output = overrides.get('math_output')
+    if math_output is not None:
+        if not hasattr(math_output, 'split') or not math_output.split():
+            raise ValueError('invalid "math_output"')
+        # the argument of HTML math output is a stylesheet file:
+        if (math_output.split()[0].lower() == 'html'
+            and len(math_output.split()) > 1):
+            raise ValueError('"math_output" must not name a stylesheet')
+
+
+class Renderer(object):
+
+    """Convert source text to document parts with fixed default settings."""
+
+    def __init__(self, settings):
+        self.settings = base_settings(settings)
+        # requests are served in threads, which must not fork:
+        self.settings.parallel_sections = 0
+
+    def render(self, request):
+        """Handle the decoded `request` and return the response object."""
+        response = {'id': request.get('id')}
+        try:
+            check_settings(request.get('settings', {}))
+        except ValueError as err:
+            response['error'] = 'Invalid request: %s' % err
+            return response
+        settings = self.settings.copy()
+        for name, value in request.get('settings', {}).items():
+            setattr(settings, name, value)
+        settings._source = request.get('source_path')
+        settings._destination = request.get('destination_path')
+        settings.record_dependencies = utils.DependencyList()
+        settings.warning_stream = io.StringIO()
+        # let exceptions propagate, they are reported in the response:
+        settings.traceback = True
+        try:
+            parts = pool.convert(request['source'], settings,
+                                 settings._source, settings._destination)
+            names = request.get('parts') or list(parts)
+            response['parts'] = dict((name, parts[name]) for name in names
+                                     if name in parts)
+        except (Exception, SystemExit) as err:
+            response['error'] = '%s: %s' % (err.__class__.__name__, err)
+        else:
+            response['dependencies'] = settings.record_dependencies.list
+        response['messages'] = settings.warning_stream.getvalue()
+        return response
+
+    def handle_line(self, line):
+        """Handle one JSON-encoded request and return the encoded response."""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict) or 'source' not in request:
+                raise ValueError('request must be an object with "source"')
+        except ValueError as err:
+            response = {'id': None, 'error': 'Invalid request: %s' % err}
+        else:
+            response = self.render(request)
+        return json.dumps(response) + '\n'
+
+
+def serve_stdio(renderer, stdin, stdout):
+    """Answer the requests read from `stdin` on `stdout`."""
+    for line in iter(stdin.readline, ''):
+        if not line.strip():
+            continue
+        stdout.write(renderer.handle_line(line))
+        stdout.flush()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    """Answer the requests of one client connection."""
+
+    def handle(self):
+        for line in iter(self.rfile.readline, b''):
+            if not line.strip():
+                continue
+            response = self.server.renderer.handle_line(line.decode('utf-8'))
+            self.wfile.write(response.encode('utf-8'))
+            self.wfile.flush()
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    """Serve every client connection in its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, path, renderer):
+        if os.path.exists(path):
+            os.remove(path)  # stale socket of a previous server
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+        self.renderer = renderer
+
+
+def serve(settings):
+    """
+    Serve requests on the Unix domain socket ``settings.socket`` or,
+    if no socket is given, on stdin/stdout.  Return the exit status.
+    """
+    renderer = Renderer(settings)
+    if not settings.socket:
+        serve_stdio(renderer, sys.stdin, sys.stdout)
+        return 0
+    server = UnixServer(settings.socket, renderer)
+    # remove the socket on termination, too:
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(settings.socket)
+    return 0
@@ -0,0 +1,200 @@
+# Author: IGARASHI Masanao <syoux2@gmail.com>
+# Copyright: This module has been placed in the public domain.
+
+"""
+Watch a source tree and convert the documents affected by a change.
+
+A reverse dependency map (dependency -> documents) is built from the files
+recorded in ``settings.record_dependencies`` (embedded stylesheets, images,
+included files) plus the template, so that e.g. editing the stylesheet
+converts only the documents that embed it.  Changes are detected with
+Linux inotify when available, else by polling the file modification times.
+"""
+
+import ctypes
+import ctypes.util
+import multiprocessing
+import os
+import os.path
+import select
+import sys
+import time
+from htmlwriter import batch
+
+
+class Inotify(object):
+
+    """Wait for changes in a set of directories with Linux inotify."""
+
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    # | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    mask = 0x002 | 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200 | 0x400
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        self.directories = set()
+
+    def watch(self, directory):
+        if directory in self.directories:
+            return
+        path = directory.encode(sys.getfilesystemencoding())
+        if self.libc.inotify_add_watch(self.fd, path, self.mask) >= 0:
+            self.directories.add(directory)
+
+    def wait(self, timeout):
+        """Wait up to `timeout` seconds (None: forever) for events."""
+        if select.select([self.fd], [], [], timeout)[0]:
+            os.read(self.fd, 65536)  # the events are not needed
+
+
+class Poller(object):
+
+    """Fallback for systems without inotify: wait a fixed interval."""
+
+    interval = 1.0
+
+    def watch(self, directory):
+        pass
+
+    def wait(self, timeout):
+        time.sleep(self.interval if timeout is None else timeout)
+
+
+def monitor():
+    """Return an `Inotify` instance if possible, else a `Poller`."""
+    try:
+        return Inotify()
+    except (OSError, AttributeError, TypeError):
+        return Poller()
+
+
+def stamp(path):
+    """Return the modification time and size of `path` (None if missing)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+class Watcher(object):
+
+    """Keep the output tree of a batch conversion up to date."""
+
+    delay = 0.2
+    """Seconds without further changes before converting (coalesces saves)."""
+
+    def __init__(self, settings, monitor):
+        self.settings = settings
+        self.monitor = monitor
+        self.outputs = {}
+        """Mapping absolute source path -> (source, destination)."""
+        self.dependencies = {}
+        """Mapping absolute source path -> absolute dependency paths."""
+        self.dependents = {}
+        """Mapping absolute dependency path -> absolute source paths."""
+        self.stamps = {}
+        self.scan()
+
+    def scan(self):
+        """Return the set of watched files that changed since the last scan."""
+        source_dir = self.settings._source
+        destination_dir = self.settings._destination
+        for dirpath, filenames in batch.walk(source_dir, destination_dir):
+            self.monitor.watch(os.path.abspath(dirpath))
+        self.outputs = dict(
+            (os.path.abspath(source), (source, destination))
+            for source, destination in batch.find_sources(
+                source_dir, destination_dir, self.settings.source_suffix))
+        stamps = {}
+        for path in self.outputs:
+            stamps[path] = stamp(path)
+        for path in self.dependents:
+            self.monitor.watch(os.path.dirname(path))
+            stamps[path] = stamp(path)
+        changed = set(path for path in set(stamps) | set(self.stamps)
+                      if stamps.get(path) != self.stamps.get(path))
+        self.stamps = stamps
+        return changed
+
+    def affected(self, changed):
+        """Return the absolute paths of the sources affected by `changed`."""
+        sources = set(path for path in changed if path in self.outputs)
+        for path in changed:
+            sources.update(self.dependents.get(path, ()))
+        return sources & set(self.outputs)
+
+    def convert(self, sources, processes=1):
+        """Convert `sources` and update the dependency maps."""
+        jobs = [self.outputs[path] for path in sorted(sources)]
+        failures = 0
+        results = batch.render_files(jobs, self.settings, processes)
+        for source, destination, dependencies, outputs, error in results:
+            if error:
+                failures += 1
+                sys.stderr.write('%s: %s\n' % (source, error.rstrip()))
+                continue  # keep the old dependencies
+            sys.stderr.write('%s -> %s\n' % (source, destination))
+            dependencies = set(os.path.abspath(path) for path
+                               in dependencies + [self.settings.template])
+            self.set_dependencies(os.path.abspath(source), dependencies)
+        # watch the new dependencies (also outside the source tree) and
+        # record their state:
+        for path in self.dependents:
+            self.monitor.watch(os.path.dirname(path))
+            self.stamps.setdefault(path, stamp(path))
+        return failures
+
+    def set_dependencies(self, source, dependencies):
+        for path in self.dependencies.get(source, ()):
+            self.dependents[path].discard(source)
+            if not self.dependents[path]:
+                del self.dependents[path]
+        self.dependencies[source] = dependencies
+        for path in dependencies:
+            self.dependents.setdefault(path, set()).add(source)
+
+    def run(self):
+        """Convert all documents, then wait for and process changes."""
+        processes = self.settings.jobs or multiprocessing.cpu_count()
+        self.convert(self.outputs, min(processes, len(self.outputs)))
+        changed = set()
+        timeout = None
+        while True:
+            self.monitor.wait(timeout)
+            new = self.scan()
+            if new:
+                # wait until the burst of changes is over:
+                changed |= new
+                timeout = self.delay
+                continue
+            if changed:
+                for path in changed - set(self.outputs):
+                    if path in self.dependencies:  # deleted source
+                        self.set_dependencies(path, ())
+                        del self.dependencies[path]
+                self.convert(self.affected(changed))
+            changed = set()
+            timeout = None
+
+
+def watch(settings):
+    """
+    Convert the source tree ``settings._source`` to ``settings._destination``
+    and keep it up to date until interrupted.  Return the exit status.
+    """
+    if not (settings._source and os.path.isdir(settings._source)):
+        sys.stderr.write('--watch: SOURCE must be a directory.\n')
+        return 2
+    if not settings._destination:
+        sys.stderr.write('--watch: DESTINATION directory required.\n')
+        return 2
+    try:
+        Watcher(settings, monitor()).run()
+    except KeyboardInterrupt:
+        pass
+    return 0